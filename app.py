@@ -1,12 +1,21 @@
 import streamlit as st
-from src import auth, data_files, data, ui
+from src import auth, data_files, data, perf, refresh, ui
 
 
 def run():
     """Main streamlit app entry point"""
-    # Fetch source data - do this before auth to ensure all requests to app cause data refresh
-    with st.spinner("Initializing..."):
-        rvudata = data.initialize(data_files.get())
+    perf.start_run()
+
+    # Latest data set, rebuilt in the background when data files change. This run keeps using the same
+    # data set even if a new one is swapped in. Only the first request after the server starts may wait.
+    # If it could not be built, the error is shown after login, and files can still be uploaded.
+    init_error = None
+    with st.spinner("Initializing..."), perf.span("initialize") as span:
+        try:
+            rvudata = refresh.get()
+        except Exception as e:
+            rvudata, init_error = None, e
+        span.rows = len(rvudata.df.index) if rvudata is not None else 0
 
     # Authenticate user
     if not auth.authenticate():
@@ -16,21 +25,30 @@ def run():
     qps = st.query_params
     if qps.get("update") == "1":
         # Allow user to upload new data files
-        files, remove_existing = ui.render_upload(data_files.get_local())
+        files, remove_existing = ui.render_upload(data_files.get_local(), rvudata)
         if files:
-            # Write new files to data dir and list contents
-            data_files.update_local(files, remove_existing)
-            st.success("Data files updated.")
+            # Check new files and write the valid ones to data dir
+            with st.spinner("Checking files..."):
+                added, removed, checks = data_files.update_local(
+                    files, remove_existing, data.check_upload
+                )
+            ui.render_upload_checks(checks)
+            if added or removed:
+                st.success(
+                    "Data files updated. The dashboard will show the new data once it is processed."
+                )
+                # Merge the changed files into the data set in the background
+                refresh.trigger()
             st.write("Data files:")
             st.write(data_files.get_local())
-
-            # Force data.initialize() to reread data from disk on next run
-            st.cache_data.clear()
         return st.stop()
 
     # If no data available, display message and stop
     if rvudata is None:
-        st.write("No data available. Contact administrator for details.")
+        if init_error is not None:
+            st.error(f"{init_error}. Contact administrator for details.")
+        else:
+            st.write("No data available. Contact administrator for details.")
         return st.stop()
 
     # Add sidebar widgets and get dashboard configuration
@@ -43,6 +61,15 @@ def run():
         visit_log_file,
     ) = ui.render_sidebar(rvudata.start_date, rvudata.end_date)
 
+    # All providers view: stats for every provider in one pass, without comparison or visit log
+    if provider == data.ALL_PROVIDERS:
+        group = data.process_all(rvudata, start_date, end_date)
+        with perf.span("render_group"):
+            ui.render_group(group)
+        if qps.get("perf") == "1":
+            ui.render_perf(perf.spans())
+        return
+
     # Filter data and calculate stats
     filtered = data.process(rvudata, provider, start_date, end_date)
     compare = (
@@ -57,7 +84,12 @@ def run():
         visit_data = data.validate_visits(filtered, visit_log_file.getvalue())
 
     # Show main display
-    ui.render_main(filtered, compare, visit_data)
+    with perf.span("render_main"):
+        ui.render_main(filtered, compare, visit_data)
+
+    # Timing for this run, if requested by ?perf=1
+    if qps.get("perf") == "1":
+        ui.render_perf(perf.spans())
 
 
 st.set_page_config(page_title="RVU Dashboard", layout="wide")
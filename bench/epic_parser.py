@@ -0,0 +1,30 @@
+"""
+Compare the vectorized Epic fixed width parser against the line by line parser.
+
+Usage, from the repo root:
+    python -m bench.epic_parser [number of lines]
+"""
+
+import sys
+import time
+from src import data_parser
+from .synth import epic_bytes
+
+
+def _time(fn, byts: bytes) -> float:
+    start = time.perf_counter()
+    fn(byts)
+    return time.perf_counter() - start
+
+
+def main(nrows: int) -> None:
+    byts = epic_bytes(nrows)
+    line_by_line = _time(data_parser._epic_fixedwidth_text_to_df, byts)
+    vectorized = _time(data_parser._epic_fixedwidth_to_df, byts)
+    print(f"{nrows} lines, {len(byts) / 1e6:.1f} MB")
+    print(f"line by line: {line_by_line:.2f}s")
+    print(f"vectorized:   {vectorized:.2f}s ({line_by_line / vectorized:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,299 @@
+"""
+End-to-end benchmark: generates synthetic data files with bench.synth, then times each stage of loading
+and processing data. Prints one JSON document with wall time and peak memory for every stage and size,
+so results from different commits can be compared.
+
+Usage, from the repo root:
+    python -m bench.run [--rows 10000 100000 ...] [--gw-rows N] [--out results.json]
+"""
+
+import os
+import sys
+import time
+import json
+import types
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import datetime as dt
+import numpy as np
+import pandas as pd
+from src import data, data_parser, fig, parse_cache, store
+from . import synth
+
+# Seconds between samples of the process's resident memory
+RSS_INTERVAL = 0.005
+
+
+def _rss() -> int:
+    """Current resident memory of this process in bytes (Linux)"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class _PeakRss:
+    """Sample resident memory in a background thread while the block runs, and record the peak"""
+
+    def __enter__(self):
+        self.start = self.peak = _rss()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._done.wait(RSS_INTERVAL):
+            self.peak = max(self.peak, _rss())
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss())
+
+
+def _measure(results: list, stage: str, rows: int, fn, *args):
+    """Run fn(*args) and append its wall time and memory to results. Returns fn's result."""
+    with _PeakRss() as rss:
+        start = time.perf_counter()
+        value = fn(*args)
+        seconds = time.perf_counter() - start
+    results.append(
+        {
+            "stage": stage,
+            "rows": rows,
+            "seconds": round(seconds, 4),
+            "peak_rss_mb": round(rss.peak / 2**20, 1),
+            "added_rss_mb": round((rss.peak - rss.start) / 2**20, 1),
+        }
+    )
+    print(
+        f"{rows:>10} {stage:<24} {seconds:8.3f}s {rss.peak / 2**20:8.0f} MB",
+        file=sys.stderr,
+    )
+    return value
+
+
+def _visit_log(df: pd.DataFrame, nrows: int) -> bytes:
+    """Visit log CSV sampled from df, with some codes changed so they don't match"""
+    sample = df.sample(min(nrows, len(df.index)), random_state=0)
+    cpt = sample.cpt.astype(str).to_numpy()
+    cpt[::10] = "99999"
+    log = pd.DataFrame(
+        {
+            "date": sample.date.dt.strftime("%m/%d/%Y"),
+            "mrn": sample.mrn,
+            "docid": np.arange(len(sample.index)),
+            "cpt": cpt,
+        }
+    )
+    return log.to_csv(header=False, index=False).encode()
+
+
+def _figures(filtered: data.FilteredRvuData) -> None:
+    """Build every figure shown on the main page, discarding the output"""
+    sink = types.SimpleNamespace(plotly_chart=lambda *args, **kwargs: None)
+    charts, stats, partitions = filtered.charts, filtered.stats, filtered.partitions
+    for fn in [
+        fig.st_enc_by_month_fig,
+        fig.st_enc_by_quarter_fig,
+        fig.st_enc_by_day_fig,
+        fig.st_rvu_by_month_fig,
+        fig.st_rvu_by_quarter_fig,
+        fig.st_rvu_by_day_fig,
+        fig.st_inpt_encs_fig,
+    ]:
+        fn(charts, sink)
+    for fn in [
+        fig.st_sick_visits_fig,
+        fig.st_sick_vs_well_fig,
+        fig.st_wcc_visits_fig,
+        fig.st_inpt_vs_outpt_encs_fig,
+        fig.st_inpt_vs_outpt_rvu_fig,
+    ]:
+        fn(stats, sink)
+    fig.st_non_encs_fig(partitions, sink)
+
+
+def _save(store_key: str, rvudata: data.RvuData) -> None:
+    """Save the data set like initialize() does, but fail if it wasn't stored instead of only logging it"""
+    data._save_stored(store_key, rvudata)
+    if not store.exists(store_key):
+        raise RuntimeError("Data set could not be stored, see log for details")
+
+
+def _open(store_key: str) -> data.RvuData:
+    """Open the stored data set like initialize() does, failing if it can't be read"""
+    rvudata = data._load_stored(store_key)
+    if rvudata is None:
+        raise RuntimeError("Stored data set could not be opened, see log for details")
+    return rvudata
+
+
+def run(
+    rows: int, gw_rows: int, workdir: str, results: list, provider: str = "Lee"
+) -> None:
+    """Generate files with the given number of rows and time each stage"""
+    files = synth.write_files(os.path.join(workdir, "data"), rows, gw_rows)
+
+    # Parsing single files
+    if rows > 0:
+        epic = files[0]
+        _measure(
+            results, "get_df_from_path:epic", rows, data_parser.get_df_from_path, epic
+        )
+        with open(epic, "rb") as f:
+            byts = f.read()
+        _measure(results, "get_df:epic", rows, data_parser.get_df, epic, byts)
+        del byts
+    if gw_rows > 0:
+        gw = files[-1]
+        with open(gw, "rb") as f:
+            byts = f.read()
+        nrows = min(gw_rows, synth.GW_MAX_ROWS - 1)
+        _measure(results, "get_df:gw", nrows, data_parser.get_df, gw, byts)
+
+    # Build data set, without and with cached parsed files. initialize() also uses the data set store
+    # and the last data set built, so call _build() directly.
+    total = rows + gw_rows
+    parse_cache.PARSED_PATH = os.path.join(workdir, "parsed")
+    data._latest = None
+    _measure(results, "initialize:cold", total, data._build, files)
+    rvudata = _measure(results, "initialize:parse_cached", total, data._build, files)
+
+    # Save the data set to the shared store, and open it as another server process would
+    store.STORE_PATH = os.path.join(workdir, "store")
+    store_key = store.key(files)
+    _measure(results, "store:save", total, _save, store_key, rvudata)
+    rvudata = _measure(results, "initialize:stored", total, _open, store_key)
+
+    # Process all dates for one provider, without and with the process() cache
+    start_date, end_date = rvudata.start_date.date(), rvudata.end_date.date()
+    data._processed.clear()
+    filtered = _measure(
+        results,
+        "process:cold",
+        total,
+        data.process,
+        rvudata,
+        provider,
+        start_date,
+        end_date,
+    )
+    _measure(
+        results,
+        "process:cached",
+        total,
+        data.process,
+        rvudata,
+        provider,
+        start_date,
+        end_date,
+    )
+    _measure(
+        results,
+        "process_all:cold",
+        total,
+        data.process_all,
+        rvudata,
+        start_date,
+        end_date,
+    )
+    _measure(
+        results,
+        "_calc_partitions",
+        len(filtered.df.index),
+        data._calc_partitions,
+        filtered.df,
+    )
+    start, end = data._day_range(start_date, end_date)
+    _measure(
+        results,
+        "_calc_stats",
+        len(filtered.df.index),
+        lambda: data._calc_stats(
+            *data._cube_totals(rvudata.daily[provider], start, end)
+        ),
+    )
+    _measure(results, "figures", len(filtered.df.index), _figures, filtered)
+
+    # Validate a visit log, building the provider's index the first time
+    log = _visit_log(rvudata.df.iloc[rvudata.by_provider[provider]], 5000)
+    data._visit_indexes.clear()
+    data._validated.clear()
+    _measure(
+        results, "validate_visits:cold", total, data.validate_visits, filtered, log
+    )
+    _measure(
+        results, "validate_visits:cached", total, data.validate_visits, filtered, log
+    )
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def main(args: list[str] = None) -> dict:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000],
+        help="Epic rows per run (up to 10M)",
+    )
+    parser.add_argument(
+        "--gw-rows",
+        type=int,
+        default=5_000,
+        help="Greenway rows per run, split into .xls files of 65,534 rows. Data sets mix Epic and Greenway files unless 0.",
+    )
+    parser.add_argument(
+        "--out", help="Write JSON results to this file instead of stdout"
+    )
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep generated files in the temp directory"
+    )
+    opts = parser.parse_args(args)
+
+    results = []
+    for rows in opts.rows:
+        workdir = tempfile.mkdtemp(prefix="rvu-bench-")
+        try:
+            run(rows, opts.gw_rows, workdir, results)
+        finally:
+            if not opts.keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "timestamp": dt.datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "cpus": os.cpu_count(),
+        "ingest_workers": data.INGEST_WORKERS,
+        "results": results,
+    }
+    if opts.out:
+        with open(opts.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
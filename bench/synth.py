@@ -0,0 +1,243 @@
+"""
+Generate realistic synthetic data files in the formats read by src.data_parser: fixed width Epic
+virtual prints (.txt) and Greenway exports (.xls).
+
+Usage, from the repo root:
+    python -m bench.synth [number of rows] [output directory]
+"""
+
+import os
+import sys
+import datetime as dt
+import numpy as np
+from src import data_parser
+
+# Epic and Greenway spell provider names differently. See providers.json.
+EPIC_PROVIDERS = [
+    "LEE, JONATHAN",
+    "FROSTAD, MICHAEL",
+    "GORDON, METHUEL",
+    "HRYNIEWICZ, KATHRYN",
+    "RINALDI, MACKENZIE",
+    "SHIELDS, MARICARMEN",
+]
+GW_PROVIDERS = [
+    "Lee , Jonathan MD",
+    "Frostad, Michael J. MD",
+    "Gordon, Methuel A. MD",
+    "Hryniewicz, Kathryn N. MD",
+    "Shields, Maricarmen S. MD",
+]
+
+# First charge of each visit: (cpt, description, wRVU, relative frequency)
+VISIT_CODES = [
+    ("99212", "OFFICE VISIT EST LEVEL 2", 0.70, 4),
+    ("99213", "OFFICE VISIT EST LEVEL 3", 1.30, 20),
+    ("99214", "OFFICE VISIT EST LEVEL 4", 1.92, 10),
+    ("99215", "OFFICE VISIT EST LEVEL 5", 2.80, 1),
+    ("99203", "OFFICE VISIT NEW LEVEL 3", 1.60, 2),
+    ("99204", "OFFICE VISIT NEW LEVEL 4", 2.60, 1),
+    ("99391", "WCC EST INFANT", 1.37, 6),
+    ("99392", "WCC EST 1-4 YRS", 1.50, 6),
+    ("99393", "WCC EST 5-11 YRS", 1.50, 5),
+    ("99394", "WCC EST 12-17 YRS", 1.70, 4),
+    ("99381", "WCC NEW INFANT", 1.50, 1),
+    ("99495", "TRANSITIONAL CARE MOD", 2.78, 0.3),
+    ("12001", "SIMPLE REPAIR 2.5CM", 0.84, 0.3),
+    ("99460", "NEWBORN INITIAL CARE", 1.92, 1.5),
+    ("99462", "NEWBORN SUBSEQUENT CARE", 0.84, 1),
+    ("99238", "HOSPITAL DISCHARGE", 1.50, 1),
+    ("99222", "INITIAL HOSPITAL CARE", 2.61, 0.5),
+    ("99232", "SUBSEQUENT HOSPITAL CARE", 1.59, 1),
+]
+# Inpatient codes are billed at the hospital
+INPATIENT_CODES = {"99460", "99462", "99238", "99222", "99232"}
+# Other charges on the same visit: shots, screening, etc
+OTHER_CODES = [
+    ("90460", "IMMUNIZATION ADMIN 1ST", 0.17, 6),
+    ("90461", "IMMUNIZATION ADMIN EA ADDL", 0.15, 3),
+    ("96110", "DEVELOPMENTAL SCREENING", 0.00, 2),
+    ("99188", "FLUORIDE VARNISH", 0.20, 1),
+    ("87880", "STREP A ASSAY W/OPTIC", 0.00, 1),
+]
+INSURANCE = [
+    ("MEDICAID WA", 4),
+    ("PREMERA BLUE CROSS", 3),
+    ("REGENCE BLUESHIELD", 2),
+    ("UNITED HEALTHCARE", 1),
+    ("SELF PAY", 0.3),
+]
+EPIC_LOCATIONS = ("CC WPL PULLMAN CLINIC", "CC WPL PULLMAN REGIONAL HOSPITAL")
+GW_LOCATIONS = ("Palouse Pediatrics Pullman", "Pullman Regional Hospital IP")
+
+# Visits are spread over this many days starting at START_DATE
+START_DATE = dt.date(2021, 1, 1)
+NDAYS = 3 * 365
+
+# Greenway files are .xls, which are limited to 65,536 rows including the header
+GW_MAX_ROWS = 65_535
+
+
+def _choose(rng: np.random.Generator, choices: list[tuple], n: int) -> np.ndarray:
+    """Index into choices for n rows, weighted by the last item of each choice"""
+    weights = np.array([c[-1] for c in choices], dtype=float)
+    return rng.choice(len(choices), size=n, p=weights / weights.sum())
+
+
+def make_rows(
+    nrows: int, seed: int = 0, providers: list[str] = EPIC_PROVIDERS
+) -> dict[str, np.ndarray]:
+    """
+    Generate nrows charges as arrays keyed by data_parser.COLUMN_NAMES. Charges are grouped into visits:
+    an E&M, well child, or inpatient code, followed by zero or more other charges on the same date and MRN.
+    """
+    rng = np.random.default_rng(seed)
+    nvisits = max(1, nrows * 2 // 3)
+    npatients = max(1, nvisits // 4)
+
+    # Assign rows to visits in order, so the first row of each visit gets the visit code
+    visit = np.sort(rng.integers(0, nvisits, nrows))
+    first = np.r_[True, visit[1:] != visit[:-1]]
+
+    visit_code = _choose(rng, VISIT_CODES, nvisits)[visit]
+    other_code = _choose(rng, OTHER_CODES, nrows)
+    codes = [np.array([c[i] for c in VISIT_CODES]) for i in range(3)]
+    other = [np.array([c[i] for c in OTHER_CODES]) for i in range(3)]
+    cpt, desc, wrvu = (
+        np.where(first, codes[i][visit_code], other[i][other_code]) for i in range(3)
+    )
+    inpatient = np.isin(codes[0][visit_code], list(INPATIENT_CODES))
+
+    visit_day = rng.integers(0, NDAYS, nvisits)[visit]
+    posted_day = visit_day + rng.geometric(0.15, nrows).clip(max=90) - 1
+    start = np.datetime64(START_DATE, "D")
+    insurance = np.array([i[0] for i in INSURANCE])[_choose(rng, INSURANCE, npatients)]
+    mrn = rng.integers(0, npatients, nvisits)[visit]
+
+    return {
+        "posted_date": start + posted_day,
+        "date": start + visit_day,
+        "provider": np.array(providers)[rng.integers(0, len(providers), nvisits)][
+            visit
+        ],
+        "mrn": (mrn + 1_000_000).astype(str),
+        "visitid": (visit + 50_000_000).astype(str),
+        "cpt": cpt,
+        "desc": desc,
+        "units": np.ones(nrows, dtype=int),
+        "wrvu": wrvu.astype(float),
+        "charge": np.round(wrvu.astype(float) * 95 + 25, 2),
+        "net": np.round(wrvu.astype(float) * 60 + 15, 2),
+        "insurance": insurance[mrn],
+        "location": np.where(inpatient, EPIC_LOCATIONS[1], EPIC_LOCATIONS[0]),
+    }
+
+
+def _epic_fields(rows: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    """Column values as printed by Epic, as byte strings. Each unique value is only formatted once."""
+    fields = {}
+    for column, values in rows.items():
+        uniq, inverse = np.unique(values, return_inverse=True)
+        if column in ("posted_date", "date"):
+            text = [d.strftime("%m/%d/%Y") for d in uniq.astype(dt.date)]
+        elif column in ("wrvu", "charge", "net"):
+            text = ["%.2f" % v for v in uniq.tolist()]
+        else:
+            text = [str(v) for v in uniq.tolist()]
+        fields[column] = np.array(text, dtype=bytes)[inverse]
+    return fields
+
+
+def epic_bytes(nrows: int, seed: int = 0, page_lines: int = 50) -> bytes:
+    """
+    Generate a synthetic Epic virtual print: fixed width lines at data_parser.EPIC_COLUMN_POSITIONS,
+    with a page header every page_lines lines
+    """
+    fields = _epic_fields(make_rows(nrows, seed))
+    positions = data_parser.EPIC_COLUMN_POSITIONS
+    width = positions[-1]
+
+    # Fill a (rows x line width) byte array with each column at its position
+    buf = np.full((nrows, width + 1), ord(" "), dtype=np.uint8)
+    buf[:, width] = ord("\n")
+    for i, column in enumerate(data_parser.COLUMN_NAMES):
+        start, end = positions[i], positions[i + 1]
+        if end > start:
+            values = fields[column].astype(f"S{end - start}")
+            field = values.view(np.uint8).reshape(nrows, end - start)
+            buf[:, start:end] = np.where(field == 0, ord(" "), field)
+
+    # Insert page headers, which the parser skips
+    header = b"\nPalouse Pediatrics - Charge Detail Report\nPage\n\n"
+    lines = buf.tobytes()
+    line_size = width + 1
+    pages = [
+        lines[i : i + page_lines * line_size]
+        for i in range(0, len(lines), page_lines * line_size)
+    ]
+    return header + header.join(pages)
+
+
+def write_epic(
+    path: str, nrows: int, seed: int = 0, chunk_rows: int = 1_000_000
+) -> None:
+    """Write a synthetic Epic print to path in chunks, so large files are never held in memory"""
+    with open(path, "wb") as f:
+        for i, start in enumerate(range(0, nrows, chunk_rows)):
+            f.write(epic_bytes(min(chunk_rows, nrows - start), seed + i))
+
+
+def write_gw(path: str, nrows: int, seed: int = 0) -> None:
+    """Write a synthetic Greenway .xls export with columns at data_parser.GW_SOURCE_COLUMNS"""
+    import xlwt
+
+    if nrows >= GW_MAX_ROWS:
+        raise ValueError(f".xls files are limited to {GW_MAX_ROWS - 1} rows")
+    rows = make_rows(nrows, seed, GW_PROVIDERS)
+    rows["location"] = np.where(
+        rows["location"] == EPIC_LOCATIONS[1], GW_LOCATIONS[1], GW_LOCATIONS[0]
+    )
+
+    # Column letters to 0 based indexes
+    columns = [ord(c) - ord("A") for c in data_parser.GW_SOURCE_COLUMNS.split(",")]
+    date_style = xlwt.easyxf(num_format_str="M/D/YYYY")
+    book = xlwt.Workbook()
+    sheet = book.add_sheet("Charges")
+    for col, name in zip(columns, data_parser.COLUMN_NAMES):
+        sheet.write(0, col, name)
+    for col, name in zip(columns, data_parser.COLUMN_NAMES):
+        values = rows[name]
+        if name in ("posted_date", "date"):
+            for r, v in enumerate(
+                values.astype("datetime64[D]").astype(dt.date), start=1
+            ):
+                sheet.write(r, col, v, date_style)
+        else:
+            for r, v in enumerate(values.tolist(), start=1):
+                sheet.write(r, col, v)
+    book.save(path)
+
+
+def write_files(
+    directory: str, nrows: int, gw_rows: int = 0, seed: int = 0
+) -> list[str]:
+    """
+    Write nrows of Epic prints and gw_rows of Greenway exports to directory, split into as many .xls
+    files as needed. Returns the file paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    if nrows > 0:
+        paths.append(os.path.join(directory, f"epic-{nrows}.txt"))
+        write_epic(paths[-1], nrows, seed)
+    for i, start in enumerate(range(0, gw_rows, GW_MAX_ROWS - 1)):
+        paths.append(os.path.join(directory, f"gw-{gw_rows}-{i + 1}.xls"))
+        write_gw(paths[-1], min(GW_MAX_ROWS - 1, gw_rows - start), seed + i)
+    return paths
+
+
+if __name__ == "__main__":
+    nrows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    directory = sys.argv[2] if len(sys.argv) > 2 else "data"
+    for path in write_files(directory, nrows):
+        print(path)
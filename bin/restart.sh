@@ -3,6 +3,9 @@
 OLD_PID=$(cat streamlit.pid 2>/dev/null)
 [ -z "$OLD_PID" ] && { echo "No existing process found"; exit 1; }
 
+# Prebuild the data set while the old process is still serving, so the new one opens it right away
+pipenv run python -m src.build_cache || echo "Could not prebuild data set, it will be built on first request"
+
 # Kill process and verify
 kill $OLD_PID || { echo "Existing process $OLD_PID could not be terminated"; exit 1; }
 
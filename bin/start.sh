@@ -15,6 +15,9 @@ while getopts "i" opt; do
   esac
 done
 
+# Prebuild the data set before the server accepts traffic. The server starts either way.
+pipenv run python -m src.build_cache || echo "Could not prebuild data set, it will be built on first request"
+
 if [ "$INTERACTIVE" = true ]; then
     # Interactive mode
     pipenv run streamlit run app.py
@@ -0,0 +1,44 @@
+"""
+Prebuild the data set store (see store.py) from the app's data files, so the server can open it right away
+instead of parsing files on the first request. Run by bin/start.sh before the server starts.
+
+Usage, from the repo root:
+    python -m src.build_cache
+"""
+
+import sys
+import time
+import logging
+from streamlit.runtime.secrets import secrets_singleton
+
+
+def main() -> int:
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
+    )
+    # Promote .streamlit/secrets.toml values to environment variables, as the server does at startup. Settings
+    # such as STREAMLIT_DATA_FILES are read from the environment when the modules below are imported.
+    secrets_singleton.load_if_toml_exists()
+    from . import data, data_files
+
+    start = time.perf_counter()
+    files = data_files.get()
+    if not files:
+        # Do not store an empty data set, which would replace the one the server is using
+        logging.error("No data files found")
+        return 1
+    rvudata = data.initialize(files)
+    if rvudata is None:
+        logging.error(f"No data in {len(files)} data files")
+        return 1
+    if not data.is_stored(files):
+        logging.error("Data set was built but could not be stored")
+        return 1
+    logging.info(
+        f"Data set ready: {len(rvudata.df.index)} rows from {len(files)} files in {time.perf_counter() - start:.1f}s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
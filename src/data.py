@@ -1,30 +1,42 @@
 import io
+import os
+import json
+import hashlib
 import re
+import pickle
+import uuid
 import typing
 import logging
-import requests
+import dataclasses
+import numpy as np
 import pandas as pd
 import datetime as dt
-import streamlit as st
-from . import data_parser
+import multiprocessing
+import concurrent.futures
+from . import data_parser, fetch, lru, parse_cache, perf, store
 from dataclasses import dataclass
-from pprint import pformat
-
-# Mapping from provider's short name to key in source data
-KNOWN_PROVIDER = ["Lee", "Mike", "Gordon", "Katie", "Kenzie", "Shields"]
-PROVIDER_TO_ALIAS = {
-    "Lee , Jonathan MD": "Lee",
-    "LEE, JONATHAN": "Lee",
-    "Frostad, Michael J. MD": "Mike",
-    "FROSTAD, MICHAEL": "Mike",
-    "Gordon, Methuel A. MD": "Gordon",
-    "GORDON, METHUEL": "Gordon",
-    "Hryniewicz, Kathryn N. MD": "Katie",
-    "HRYNIEWICZ, KATHRYN": "Katie",
-    "RINALDI, MACKENZIE": "Kenzie",
-    "Shields, Maricarmen S. MD": "Shields",
-    "SHIELDS, MARICARMEN": "Shields",
-}
+
+# Provider alias file: JSON object of each provider's short name to the names used for them in source
+# data. Defaults to rvu-dash/providers.json.
+PROVIDERS_FILE = os.environ.get(
+    "STREAMLIT_PROVIDERS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "providers.json"),
+)
+
+
+def _load_providers(path: str) -> dict[str, str]:
+    """Read the provider alias file. Returns a mapping from each name in source data to its alias."""
+    with open(path) as f:
+        aliases = json.load(f)
+    return {name: alias for alias, names in aliases.items() for name in names}
+
+
+# Mapping from key in source data to provider's short name
+PROVIDER_TO_ALIAS = _load_providers(PROVIDERS_FILE)
+# Provider short names, in the order listed in the alias file
+KNOWN_PROVIDER = list(dict.fromkeys(PROVIDER_TO_ALIAS.values()))
+# Provider selection for the group wide view (see process_all())
+ALL_PROVIDERS = "All providers"
 # Specific location strings that indicate an inpatient charge
 INPT_LOCATIONS = [
     "Pullman Regional Hospital IP",
@@ -33,6 +45,94 @@ INPT_LOCATIONS = [
 ]
 # Regex matching outpatient procedure CPT codes
 RE_PROCEDURE_CODES = "54150|41010|120[01][1-8]"
+# Regexes matching well child check and sick visit CPT codes
+RE_WCC_CODES = "993[89][1-5]"
+RE_SICK_CODES = f"992[01][1-5]|9949[56]|{RE_PROCEDURE_CODES}"
+RE_TCM_CODES = "9949[56]"
+# Regex matching inpatient encounter CPT codes
+RE_INPT_CODES = "|".join(
+    [
+        "9946[023]|9923[89]",  # newborn attendance, resusc, admit, progress, d/c, same day
+        "992[23][1-3]",  # inpatient admit, progress
+        "9947[7-9]|99480",  # intensive care
+        "99291",  # transfer or critical care (not additional time code 99292)
+        "9925[3-5]",  # inpatient consult
+        "9921[89]|9922[1-6]|9923[1-9]",  # peds admit, progress, d/c
+    ]
+)
+# E&M levels for sick visit codes 992x1 to 992x5
+EM_LEVELS = [1, 2, 3, 4, 5]
+# WCC age bands for codes 993x1 to 993x5
+WCC_BANDS = ["infant", "1to4", "5to11", "12to17", "adult"]
+# Low cardinality text columns that are stored as categoricals to save memory
+CATEGORY_COLUMNS = [
+    "provider",
+    "alias",
+    "cpt",
+    "desc",
+    "insurance",
+    "location",
+    "month",
+    "quarter",
+    "posted_month",
+    "posted_quarter",
+    "source",
+]
+# Max memory used to cache results of process() for recently viewed providers and date ranges
+PROCESS_CACHE_MB = int(os.environ.get("STREAMLIT_PROCESS_CACHE_MB") or 512)
+# Number of files fetched and parsed in parallel by initialize(). Set to 1 to read files one at a time.
+INGEST_WORKERS = int(os.environ.get("STREAMLIT_INGEST_WORKERS") or os.cpu_count() or 1)
+# Max memory used to cache visit log indexes and validation results
+VALIDATE_CACHE_MB = int(os.environ.get("STREAMLIT_VALIDATE_CACHE_MB") or 128)
+# Which copy is kept when the same charge is read from more than one data file, e.g. exports of overlapping
+# date ranges: "first" keeps the copy from the first file listed, "newest" prefers the most recently modified
+# file for the posted dates it covers. See _find_duplicates().
+DEDUP = os.environ.get("STREAMLIT_DEDUP") or "first"
+
+
+@dataclass(eq=True, frozen=True)
+class DateIndex:
+    """
+    Dates of a provider's transactions as day numbers (days since 1970-01-01) for fast range lookups.
+    The provider's DataFrame is sorted by visit date, so rows with visit dates in a range are contiguous.
+    """
+
+    # Visit date of each row, ascending. Missing dates sort first.
+    day: np.ndarray
+    # Row positions ordered by posted date
+    posted_order: np.ndarray
+    # Posted date of each row in posted_order, ascending
+    posted_day: np.ndarray
+
+
+@dataclass(eq=True, frozen=True)
+class DailyCube:
+    """
+    Additive metrics from _calc_metrics() for each visit date of a provider's transactions, with
+    prefix sums so totals for any range of days only take two lookups.
+    """
+
+    # Visit dates with transactions as day numbers, ascending
+    day: np.ndarray
+    # Metric names, one per column of cumsum
+    metrics: list[str]
+    # Row i holds totals for all days before day[i]. Has one more row than day.
+    cumsum: np.ndarray
+
+
+@dataclass(eq=True, frozen=True)
+class SourceFile:
+    """A data file read into a data set"""
+
+    # Modification time of the file, or of the local copy of a URL
+    mtime: float
+    # Rows read from the file, including duplicates
+    rows: int
+    # Range of posted dates in the file as day numbers. Empty (start_day > end_day) if no rows have a posted date.
+    start_day: int
+    end_day: int
+    # Rows dropped because the same charge was kept from another file
+    duplicates: int = 0
 
 
 @dataclass(eq=True, frozen=True)
@@ -45,8 +145,21 @@ class RvuData:
     start_date: dt.date
     # Latest posting date in data
     end_date: dt.date
-    # DataFrames for each provider's data
-    by_provider: dict[str, pd.DataFrame]
+    # Row positions in df of each provider's data, sorted by visit date. Every provider in
+    # KNOWN_PROVIDER has an entry, which may be empty.
+    by_provider: dict[str, np.ndarray]
+    # Visit and posted date indexes for each provider's data
+    date_index: dict[str, DateIndex]
+    # Daily metrics for each provider's data
+    daily: dict[str, DailyCube]
+    # Source files read into this data set. Each row's file is in the "source" column.
+    files: list[str]
+    # Details of each file in files, including the number of duplicate rows dropped
+    sources: dict[str, SourceFile]
+    # Hash of each row in df from _row_keys(), used to find duplicates of the rows in new files
+    row_keys: np.ndarray
+    # Unique ID for this data set. Changes whenever it is built or updated.
+    version: str
 
 
 @dataclass
@@ -68,6 +181,33 @@ class FilteredRvuData:
     partitions: dict[str, pd.DataFrame]
     # Precalculated stats, e.g. # encounters, total RVUs, etc
     stats: dict[str, typing.Any]
+    # Precalculated series for charts, e.g. encounters by month
+    charts: dict[str, pd.DataFrame]
+
+
+@dataclass
+class GroupRvuData:
+    """Stats for every provider over a date range, calculated in one grouped pass by process_all()"""
+
+    start_date: dt.date
+    end_date: dt.date
+    # One row per provider alias, with the same columns as the keys of FilteredRvuData.stats
+    stats: pd.DataFrame
+    # Series for charts comparing providers, e.g. encounters by month
+    charts: dict[str, pd.DataFrame]
+
+
+@dataclass(eq=True, frozen=True)
+class VisitIndex:
+    """
+    Hash index of a provider's transactions for validating visit logs. Hashes of (visit date, MRN, CPT)
+    and of (visit date, MRN) are sorted, each with the row positions in RvuData.df.
+    """
+
+    charge: np.ndarray
+    charge_rows: np.ndarray
+    visit: np.ndarray
+    visit_rows: np.ndarray
 
 
 @dataclass
@@ -80,39 +220,34 @@ class VisitLogData:
     df: pd.DataFrame
     # Visits appearing the same in both log and RVU data
     validated: pd.DataFrame
-    # Visits present in log but not RVU data or billed using a different code
+    # Visits present in log but not RVU data or billed using a different code. Codes billed for
+    # the same date and MRN are listed in billed_cpt.
     diff: pd.DataFrame
 
 
-def _fetch_file_or_url(filename_or_url: str) -> bytes:
-    """Fetch source data from the given file using open() or URL using requests library"""
-    logging.info("Fetching " + filename_or_url)
-
-    # Try to read as local file if url doesn't start with http
-    if not filename_or_url.lower().startswith("http"):
-        with open(filename_or_url, "rb") as f:
-            return f.read()
-
-    # Read as URL
-    with requests.get(filename_or_url, allow_redirects=True) as resp:
-        logging.info(
-            "Status "
-            + str(resp.status_code)
-            + " from "
-            + resp.url
-            + "\n Headers: "
-            + pformat(resp.headers)
-        )
+@dataclass
+class UploadCheck:
+    """Summary of an uploaded data file, checked before it is added to the data directory"""
 
-        resp.raise_for_status()
-        return resp.content
+    # File name as uploaded
+    name: str
+    rows: int = 0
+    # Range of posted dates, None if no rows have a valid date
+    start_date: dt.date = None
+    end_date: dt.date = None
+    # Provider names in the file without an alias in the provider alias file. These rows are not shown.
+    unknown_providers: list[str] = dataclasses.field(default_factory=list)
+    # Reason the file was rejected, None if it was accepted
+    error: str = None
 
 
 def _calc_columns(df: pd.DataFrame) -> pd.DataFrame:
     """Add extra calculated columns to source data in-place"""
     df = df.copy()
-    # Convert provider name to single word alias
-    df["alias"] = df.provider.map(PROVIDER_TO_ALIAS)
+    # Convert provider name to single word alias. Categories are fixed so data sets concatenate cheaply.
+    df["alias"] = df.provider.map(PROVIDER_TO_ALIAS).astype(
+        pd.CategoricalDtype(KNOWN_PROVIDER)
+    )
     # Month (eg. 2022-01) and quarter (eg. 2020-Q01)
     df["month"] = df.date.dt.to_period("M").dt.strftime("%Y-%m")
     df["quarter"] = df.date.dt.to_period("Q").dt.strftime("%Y Q%q")
@@ -124,52 +259,221 @@ def _calc_columns(df: pd.DataFrame) -> pd.DataFrame:
     # Inpatient?
     r_inpt = re.compile(f"^{'|'.join(INPT_LOCATIONS)}$", re.IGNORECASE)
     df["inpatient"] = df.location.apply(lambda x: bool(r_inpt.match(x)))
+    # Encounter type, E&M level, etc
+    for column, values in _classify_cpts(df.cpt).items():
+        df[column] = values
+    return _compact_dtypes(df)
+
+
+def _compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Store low cardinality text as categoricals, flags as bools, and integers in the smallest type, in-place"""
+    # Epic prints have IDs and amounts as text, and Greenway exports as numbers. A data set with both would
+    # have columns of mixed types, which can't be stored (see store.py), so use one type for each column.
+    for column in ["mrn", "visitid"]:
+        if not isinstance(df[column].dtype, pd.StringDtype):
+            df[column] = pd.Series(_as_text(df[column]), index=df.index, dtype=str)
+    for column in ["charge", "net"]:
+        if not pd.api.types.is_numeric_dtype(df[column].dtype):
+            df[column] = _as_numbers(df[column])
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns and not isinstance(
+            df[column].dtype, pd.CategoricalDtype
+        ):
+            df[column] = df[column].astype("category")
+    for column in ["medicaid", "inpatient", "tcm", "procedure", "inpt_code"]:
+        df[column] = df[column].astype(bool)
+    # wRVUs stay float64 so sums over many rows match the source reports
+    if pd.api.types.is_integer_dtype(df.units):
+        df["units"] = pd.to_numeric(df.units, downcast="integer")
     return df
 
 
-def _split_by(df: pd.DataFrame, column: str) -> dict[str, pd.DataFrame]:
+def _concat(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenate frames that have categorical columns. pd.concat() converts categoricals with
+    different categories back to text, so combine their categories first.
+    """
+    frames = [df for df in frames if len(df.columns) > 0]
+    if len(frames) <= 1:
+        return frames[0] if frames else pd.DataFrame()
+    frames = [df.copy(deep=False) for df in frames]
+    for column in frames[0].columns:
+        dtypes = [df[column].dtype for df in frames]
+        if all(isinstance(dtype, pd.CategoricalDtype) for dtype in dtypes):
+            categories = pd.api.types.union_categoricals(
+                [df[column].array for df in frames], ignore_order=True
+            ).categories
+            for df in frames:
+                df[column] = df[column].cat.set_categories(categories)
+    return pd.concat(frames)
+
+
+def memory_report(df: pd.DataFrame) -> pd.DataFrame:
+    """Memory and pickled size per column, largest first. Total for all columns in last row."""
+    report = pd.DataFrame(
+        {
+            "dtype": df.dtypes.astype(str),
+            "memory_mb": df.memory_usage(index=False, deep=True) / 1e6,
+            "pickle_mb": [len(pickle.dumps(df[c])) / 1e6 for c in df.columns],
+        }
+    ).sort_values("memory_mb", ascending=False)
+    report.loc["total"] = ["", report.memory_mb.sum(), report.pickle_mb.sum()]
+    return report
+
+
+def _classify_cpts(cpt: pd.Series) -> dict[str, typing.Any]:
+    """
+    Classify CPT codes into encounter type, E&M level, WCC age band and code type flags.
+    Each unique code is only matched against the regexes once, then mapped back to all rows.
+    """
+    r_wcc, r_sick = re.compile(RE_WCC_CODES), re.compile(RE_SICK_CODES)
+    r_tcm, r_proc = re.compile(RE_TCM_CODES), re.compile(RE_PROCEDURE_CODES)
+    r_inpt = re.compile(RE_INPT_CODES)
+    r_level, r_band = re.compile("992[01]([1-5])"), re.compile("993[89]([1-5])")
+
+    # Classify unique codes, with a trailing entry for missing codes (category code -1)
+    cats = pd.Categorical(cpt)
+    codes = list(cats.categories.astype(str))
+    enc_class, em_level, wcc_band, tcm, procedure, inpt_code = [], [], [], [], [], []
+    for code in codes:
+        enc_class.append(
+            "wcc" if r_wcc.match(code) else "sick" if r_sick.match(code) else None
+        )
+        level, band = r_level.match(code), r_band.match(code)
+        em_level.append(int(level.group(1)) if level else None)
+        wcc_band.append(WCC_BANDS[int(band.group(1)) - 1] if band else None)
+        tcm.append(bool(r_tcm.match(code)))
+        procedure.append(bool(r_proc.match(code)))
+        inpt_code.append(bool(r_inpt.match(code)))
+    for values, missing in (
+        (enc_class, None),
+        (em_level, None),
+        (wcc_band, None),
+        (tcm, False),
+        (procedure, False),
+        (inpt_code, False),
+    ):
+        values.append(missing)
+
+    def by_row(values, categories=None):
+        taken = np.array(values, dtype=object)[cats.codes]
+        if categories is None:
+            return taken.astype(bool)
+        return pd.Categorical(taken, categories=categories)
+
+    return {
+        "enc_class": by_row(enc_class, ["wcc", "sick"]),
+        "em_level": by_row(em_level, EM_LEVELS),
+        "wcc_band": by_row(wcc_band, WCC_BANDS),
+        "tcm": by_row(tcm),
+        "procedure": by_row(procedure),
+        "inpt_code": by_row(inpt_code),
+    }
+
+
+def _provider_rows(df: pd.DataFrame) -> dict[str, np.ndarray]:
     """
-    Split a dataframe into one dataframe per unique value in the specified column.
-    Returns a dict indexed by each unique value in the column.
-    Note, the returned dataframes are each views on a copy of the original dataframe.
+    Row positions of each provider's transactions in df, from one grouped pass over the alias codes.
+    Every alias in KNOWN_PROVIDER has an entry. Rows without a known provider are left out.
     """
-    # Create views for each unique column value
-    uniq = df[column].unique().tolist()
-    views = {}
-    for v in uniq:
-        views[v] = df.loc[df[column] == v]
+    return df.groupby("alias", observed=False).indices
+
+
+def _day_numbers(dates: pd.Series) -> np.ndarray:
+    """Convert datetime column to days since 1970-01-01. Missing dates become the smallest int64."""
+    return (
+        dates.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]").astype(np.int64)
+    )
+
+
+def _day_number(date: dt.date) -> int:
+    """Days since 1970-01-01 for a date or Timestamp"""
+    return int(np.datetime64(pd.Timestamp(date).date(), "D").astype(np.int64))
+
+
+def _sort_by_date(df: pd.DataFrame, rows: np.ndarray) -> tuple[np.ndarray, DateIndex]:
+    """Sort a provider's row positions in df by visit date and build its date index"""
+    day = _day_numbers(df.date.iloc[rows])
+    order = np.argsort(day, kind="stable")
+    rows, day = rows[order], day[order]
+    posted_day = _day_numbers(df.posted_date.iloc[rows])
+    posted_order = np.argsort(posted_day, kind="stable")
+    return rows, DateIndex(
+        day=day, posted_order=posted_order, posted_day=posted_day[posted_order]
+    )
+
+
+def _index_providers(
+    df: pd.DataFrame,
+    by_provider: dict[str, np.ndarray],
+    date_index: dict[str, DateIndex],
+    daily: dict[str, DailyCube],
+    aliases: typing.Iterable[str],
+) -> None:
+    """Sort and index the given providers' rows by date and build their daily metrics, in-place"""
+    aliases = list(aliases)
+    if not aliases:
+        return
+    for alias in aliases:
+        by_provider[alias], date_index[alias] = _sort_by_date(df, by_provider[alias])
+
+    # Daily metrics for all the providers in one grouped pass
+    rows = np.concatenate([by_provider[alias] for alias in aliases])
+    metrics = _calc_metrics(df.iloc[rows], keys=["alias"])
+    cubes = {
+        alias: _build_cube(provider_metrics.droplevel("alias"))
+        for alias, provider_metrics in metrics.groupby(level="alias")
+    }
+    empty = metrics.iloc[:0].droplevel("alias")
+    for alias in aliases:
+        daily[alias] = cubes[alias] if alias in cubes else _build_cube(empty)
+
+
+def _day_range(start_date: dt.date, end_date: dt.date) -> tuple[int, int]:
+    """Day numbers for an inclusive date range. Missing start or end leaves that side open."""
+    start = _day_number(start_date) if start_date else np.iinfo(np.int64).min + 1
+    end = _day_number(end_date) if end_date else np.iinfo(np.int64).max - 1
+    return start, end
+
 
-    return views
+def _date_rows(index: DateIndex, start: int, end: int) -> tuple[int, int, np.ndarray]:
+    """
+    Find rows with either visit date or posted date in range (inclusive) using binary search,
+    so the cost depends on the number of rows selected rather than size of the data set.
+    Returns the slice of rows with visit date in range, and positions of the remaining rows
+    that have posted date in range.
+    """
+    # Rows with visit date in range are contiguous
+    visit_start, visit_end = np.searchsorted(index.day, [start, end + 1])
+    # Add rows with posted date in range that weren't already selected by visit date
+    posted_start, posted_end = np.searchsorted(index.posted_day, [start, end + 1])
+    posted_rows = index.posted_order[posted_start:posted_end]
+    posted_rows = posted_rows[(posted_rows < visit_start) | (posted_rows >= visit_end)]
+    posted_rows.sort()
+    return visit_start, visit_end, posted_rows
 
 
 def _calc_partitions(df):
     """Partition data into sets meaningful to a user and used for calculating statistics later"""
     partitions = {}
 
-    # Office encounters - only keep rows that match one of these CPT codes
-    r_wcc = re.compile("993[89][1-5]")
-    r_sick = re.compile(f"992[01][1-5]|9949[56]|{RE_PROCEDURE_CODES}")
+    # Office encounters - only keep rows that match one of the WCC or sick visit CPT codes
+    is_enc = df.enc_class.notna()
     df_outpt_all = df.loc[~df.inpatient]
-    df_outpt_encs = df.loc[
-        df.cpt.apply(lambda cpt: bool(r_wcc.match(cpt) or r_sick.match(cpt)))
-    ]
+    df_outpt_encs = df.loc[is_enc]
     partitions["outpt_all"] = df_outpt_all
     partitions["outpt_encs"] = df_outpt_encs
-    partitions["outpt_not_encs"] = df_outpt_all.loc[
-        ~df_outpt_all.index.isin(df_outpt_encs.index)
-    ]
-    partitions["wcc_encs"] = df.loc[
-        (~df.inpatient) & df.cpt.apply(lambda cpt: bool(r_wcc.match(cpt)))
-    ]
-    partitions["sick_encs"] = df.loc[
-        (~df.inpatient) & df.cpt.apply(lambda cpt: bool(r_sick.match(cpt)))
-    ]
+    partitions["outpt_not_encs"] = df.loc[~df.inpatient & ~is_enc]
+    partitions["wcc_encs"] = df.loc[(~df.inpatient) & (df.enc_class == "wcc")]
+    partitions["sick_encs"] = df.loc[(~df.inpatient) & (df.enc_class == "sick")]
     partitions["outpt_medicaid_encs"] = df_outpt_encs.loc[df_outpt_encs.medicaid]
 
     # Aggregate wRVUs for non-encounter charges by CPT code. We use groupby().agg() to
     # sum wrvu column. Retain cpt and desc by using the keys "cpt", "desc" in agg() as the groupby key.
     # Provide count of how many rows were grouped by counting the any column (we chose provider).
-    groupby_cpt = partitions["outpt_not_encs"].groupby(["cpt"], as_index=False)
+    groupby_cpt = partitions["outpt_not_encs"].groupby(
+        ["cpt"], as_index=False, observed=True
+    )
     outpt_non_enc_wrvus = groupby_cpt.agg(
         {"desc": "first", "wrvu": "sum", "provider": "count"}
     ).reset_index(drop=True)
@@ -182,16 +486,7 @@ def _calc_partitions(df):
     partitions["outpt_non_enc_wrvus"] = outpt_non_enc_wrvus
 
     # Hospital charges - filter by service location and CPT codes
-    inpt_codes = "9946[023]|9923[89]"  # newborn attendance, resusc, admit, progress, d/c, same day
-    inpt_codes += "|992[23][1-3]"  # inpatient admit, progress
-    inpt_codes += "|9947[7-9]|99480"  # intensive care
-    inpt_codes += "|99291"  # transfer or critical care (not additional time code 99292)
-    inpt_codes += "|9925[3-5]"  # inpatient consult
-    inpt_codes += "|9921[89]|9922[1-6]|9923[1-9]"  # peds admit, progress, d/c
-    r_inpt = re.compile(inpt_codes)
-    df_inpt_encs = df.loc[
-        df.inpatient & df.cpt.apply(lambda cpt: bool(r_inpt.match(cpt)))
-    ]
+    df_inpt_encs = df.loc[df.inpatient & df.inpt_code]
     partitions["inpt_all"] = df.loc[df.inpatient]
     partitions["inpt_encs"] = df_inpt_encs
 
@@ -212,46 +507,188 @@ def _calc_partitions(df):
     return partitions
 
 
-def _calc_stats(df, partitions):
-    """Calculate basic statistics from pre-partitioned list of charges"""
+def _calc_charts(
+    df: pd.DataFrame, start_date: dt.date, end_date: dt.date
+) -> dict[str, pd.DataFrame]:
+    """
+    Calculate series for the encounter and wRVU charts by month, quarter and day. Totals are
+    calculated per day once, then rolled up to months and quarters.
+
+    Data was filtered on visit date OR posted date. Since charges may be posted after our specified
+    time period, encounters and wRVUs by day only include visit dates in the period to avoid confusion.
+    wRVUs by month and quarter are grouped by posted date like the clinic's production reports, so
+    numbers match what the user expects, and only exclude charges posted after the period.
+    """
+    start, end = _day_range(start_date, end_date)
+    day = _day_numbers(df.date)
+    posted_day = _day_numbers(df.posted_date)
+    wrvu = np.nan_to_num(df.wrvu.to_numpy(dtype=float))
+    is_enc = (df.enc_class.notna() | (df.inpatient & df.inpt_code)).to_numpy()
+    rows = pd.DataFrame({"day": day, "mrn": df.mrn.to_numpy(), "wrvu": wrvu})
+
+    # Visits (unique date and MRN) and wRVUs by visit date
+    in_range = (day >= start) & (day <= end)
+    visits = rows[in_range & is_enc].dropna(subset=["mrn"])
+    encs = visits.drop_duplicates(["day", "mrn"]).groupby("day").size()
+    wrvus = rows[in_range].groupby("day").wrvu.sum()
+
+    # wRVUs by posted date, excluding charges posted after the period
+    is_posted = (posted_day > np.iinfo(np.int64).min) & (posted_day <= end)
+    posted_wrvus = pd.Series(wrvu[is_posted]).groupby(posted_day[is_posted]).sum()
+
+    # Inpatient visits by date, including all dates in the data
+    inpt = rows[df.inpatient.to_numpy() & (day > np.iinfo(np.int64).min)]
+    inpt_encs = inpt.groupby("day").mrn.nunique()
+
+    def dates(series):
+        return pd.to_datetime(series.index.to_numpy().astype("datetime64[D]"))
+
+    def by_day(series, columns):
+        return pd.DataFrame({columns[0]: dates(series), columns[1]: series.to_numpy()})
+
+    def rollup(series, freq, fmt, columns):
+        labels = dates(series).to_period(freq).strftime(fmt)
+        src = series.groupby(labels).sum().reset_index()
+        src.columns = columns
+        return src
+
+    return {
+        "enc_by_month": rollup(encs, "M", "%Y-%m", ["Month", "Encounters"]),
+        "enc_by_quarter": rollup(encs, "Q", "%Y Q%q", ["Quarter", "Encounters"]),
+        "enc_by_day": by_day(encs, ["Date", "Encounters"]),
+        "rvu_by_month": rollup(posted_wrvus, "M", "%Y-%m", ["Month", "wRVUs"]),
+        "rvu_by_quarter": rollup(posted_wrvus, "Q", "%Y Q%q", ["Quarter", "wRVUs"]),
+        "rvu_by_day": by_day(wrvus, ["Date", "wRVUs"]),
+        "inpt_enc_by_day": by_day(inpt_encs, ["Date", "Encounters"]),
+    }
+
+
+def _calc_metrics(df: pd.DataFrame, keys: list[str] = None) -> pd.DataFrame:
+    """
+    Calculate additive metrics used for stats (wRVUs, units and visit counts by type) for each
+    visit date, and optionally other key columns such as provider, in a single grouped pass.
+    Summing the rows for any set of days gives the totals used by _calc_stats().
+    """
+    keys = keys or []
+    day = _day_numbers(df.date)
+    has_day = df.date.notna().to_numpy() & df.mrn.notna().to_numpy()
+    # Categorical keys are kept as categoricals, so grouping compares codes instead of strings
+    groups = [df[k].array for k in keys] + [day]
+    wrvu = np.nan_to_num(df.wrvu.to_numpy(dtype=float))
+    units = np.nan_to_num(df.units.to_numpy(dtype=float))
+    outpt = ~df.inpatient.to_numpy()
+    is_enc = df.enc_class.notna().to_numpy()
+    is_wcc = (df.enc_class == "wcc").to_numpy() & outpt
+    is_sick = (df.enc_class == "sick").to_numpy() & outpt
+    is_inpt_enc = df.inpatient.to_numpy() & df.inpt_code.to_numpy()
+    is_medicaid = is_enc & df.medicaid.to_numpy()
+
+    def first(mask, columns):
+        """1 for the first row with each combination of group keys and columns among rows in mask"""
+        rows = np.flatnonzero(mask & has_day)
+        keys = pd.DataFrame(dict(enumerate([v[rows] for v in groups + columns])))
+        ones = np.zeros(len(mask), dtype=np.int64)
+        ones[rows[~keys.duplicated().to_numpy()]] = 1
+        return ones
+
+    # A visit is a unique visit date and MRN, since we can only see each pt once per day
+    mrn = df.mrn.array
+    metrics = {
+        "rows": np.ones(len(df), dtype=np.int64),
+        "wrvu": wrvu,
+        "encs": first(is_enc | is_inpt_enc, [mrn]),
+        **{
+            f"lvl{level}": np.where(df.em_level == level, units, 0)
+            for level in EM_LEVELS
+        },
+        "tcm": np.where(df.tcm, units, 0),
+        "procedures": np.where(df.procedure, units, 0),
+        "sick_pts": first(is_sick, [mrn]),
+        "sick_wrvu": np.where(is_sick, wrvu, 0),
+        **{
+            f"wcc{band}": (df.wcc_band == band).to_numpy(dtype=np.int64)
+            for band in WCC_BANDS
+        },
+        "wcc_pts": first(is_wcc, [mrn]),
+        "wcc_wrvu": np.where(is_wcc, wrvu, 0),
+        "outpt_days": first(is_enc, []),
+        "outpt_pts": first(is_enc, [mrn]),
+        "outpt_wrvu": np.where(is_enc, wrvu, 0),
+        "medicaid_pts": first(is_medicaid, [mrn]),
+        "medicaid_wrvu": np.where(is_medicaid, wrvu, 0),
+        "inpt_pts": first(is_inpt_enc, [mrn]),
+        "inpt_wrvu": np.where(outpt, 0, wrvu),
+    }
+    metrics = pd.DataFrame(metrics)
+    for key, values in zip(keys + ["day"], groups):
+        metrics[key] = values
+    return metrics.groupby(keys + ["day"], observed=True).sum()
+
+
+def _build_cube(metrics: pd.DataFrame) -> DailyCube:
+    """Build prefix sums from a provider's metrics per day. Days without a visit date are left out."""
+    metrics = metrics[metrics.index > np.iinfo(np.int64).min]
+    cumsum = np.zeros((len(metrics) + 1, len(metrics.columns)))
+    np.cumsum(metrics.to_numpy(dtype=float), axis=0, out=cumsum[1:])
+    return DailyCube(
+        day=metrics.index.to_numpy(), metrics=list(metrics.columns), cumsum=cumsum
+    )
+
+
+def _cube_totals(
+    cube: DailyCube, start: int, end: int
+) -> tuple[pd.Series, typing.Optional[int], typing.Optional[int]]:
+    """Total metrics for visit dates in range (inclusive), and the first and last day with transactions"""
+    i, j = np.searchsorted(cube.day, [start, end + 1])
+    totals = pd.Series(cube.cumsum[j] - cube.cumsum[i], index=cube.metrics)
+    return (
+        totals,
+        (cube.day[i] if j > i else None),
+        (cube.day[j - 1] if j > i else None),
+    )
+
+
+def _calc_stats(
+    totals: pd.Series, first_day: int, last_day: int
+) -> dict[str, typing.Any]:
+    """Calculate statistics from metric totals (see _calc_metrics) and the range of visit dates"""
     stats = {}
 
+    def count(metric):
+        return int(round(totals[metric]))
+
+    def to_date(day):
+        return pd.NaT if day is None else np.datetime64(int(day), "D").item()
+
     # Global stats
-    stats["start_date"] = df.date.min().date()
-    stats["end_date"] = df.date.max().date()
-    stats["ttl_wrvu"] = df.wrvu.sum()
+    stats["start_date"] = to_date(first_day)
+    stats["end_date"] = to_date(last_day)
+    stats["ttl_wrvu"] = totals.wrvu
 
-    # group rows by date and MRN since we can only see each pt once per day, and count number of rows
-    stats["ttl_encs"] = len(partitions["all_encs"].groupby(["date", "mrn"]))
+    # Number of visits (unique date and MRN) to either inpatient or outpatient
+    stats["ttl_encs"] = count("encs")
     stats["wrvu_per_encs"] = (
         stats["ttl_wrvu"] / stats["ttl_encs"] if stats["ttl_encs"] > 0 else 0
     )
 
     # Count of various outpt codes: 99211-99215, TCM, and procedure codes
-    cptstr = df.cpt.str
-    stats["ttl_lvl1"] = df[cptstr.match("992[01]1")].units.sum()
-    stats["ttl_lvl2"] = df[cptstr.match("992[01]2")].units.sum()
-    stats["ttl_lvl3"] = df[cptstr.match("992[01]3")].units.sum()
-    stats["ttl_lvl4"] = df[cptstr.match("992[01]4")].units.sum()
-    stats["ttl_lvl5"] = df[cptstr.match("992[01]5")].units.sum()
-    stats["ttl_tcm"] = df[cptstr.match("9949[56]")].units.sum()
-    stats["ttl_procedures"] = df[cptstr.match(RE_PROCEDURE_CODES)].units.sum()
-    stats["sick_num_pts"] = len(partitions["sick_encs"].groupby(["date", "mrn"]))
-    stats["sick_ttl_wrvu"] = partitions["sick_encs"].wrvu.sum()
+    for level in EM_LEVELS:
+        stats[f"ttl_lvl{level}"] = count(f"lvl{level}")
+    stats["ttl_tcm"] = count("tcm")
+    stats["ttl_procedures"] = count("procedures")
+    stats["sick_num_pts"] = count("sick_pts")
+    stats["sick_ttl_wrvu"] = totals.sick_wrvu
 
     # Counts of WCCs
-    stats["ttl_wccinfant"] = len(df[cptstr.match("993[89]1")])
-    stats["ttl_wcc1to4"] = len(df[cptstr.match("993[89]2")])
-    stats["ttl_wcc5to11"] = len(df[cptstr.match("993[89]3")])
-    stats["ttl_wcc12to17"] = len(df[cptstr.match("993[89]4")])
-    stats["ttl_wccadult"] = len(df[cptstr.match("993[89]5")])
-    stats["wcc_num_pts"] = len(partitions["wcc_encs"].groupby(["date", "mrn"]))
-    stats["ttl_wcc_wrvu"] = partitions["wcc_encs"].wrvu.sum()
+    for band in WCC_BANDS:
+        stats[f"ttl_wcc{band}"] = count(f"wcc{band}")
+    stats["wcc_num_pts"] = count("wcc_pts")
+    stats["ttl_wcc_wrvu"] = totals.wcc_wrvu
 
     # Outpatient stats
-    stats["outpt_num_days"] = len(partitions["outpt_encs"].date.unique())
-    stats["outpt_num_pts"] = len(partitions["outpt_encs"].groupby(["date", "mrn"]))
-    stats["outpt_ttl_wrvu"] = partitions["outpt_encs"].wrvu.sum()
+    stats["outpt_num_days"] = count("outpt_days")
+    stats["outpt_num_pts"] = count("outpt_pts")
+    stats["outpt_ttl_wrvu"] = totals.outpt_wrvu
     stats["outpt_avg_wrvu_per_pt"] = (
         stats["outpt_ttl_wrvu"] / stats["outpt_num_pts"]
         if stats["outpt_num_pts"] > 0
@@ -267,10 +704,8 @@ def _calc_stats(df, partitions):
         if stats["outpt_num_days"] > 0
         else 0
     )
-    stats["outpt_medicaid_wrvu"] = partitions["outpt_medicaid_encs"].wrvu.sum()
-    stats["outpt_medicaid_pts"] = len(
-        partitions["outpt_medicaid_encs"].groupby(["date", "mrn"])
-    )
+    stats["outpt_medicaid_wrvu"] = totals.medicaid_wrvu
+    stats["outpt_medicaid_pts"] = count("medicaid_pts")
     stats["outpt_medicaid_wrvu_per_pt"] = (
         stats["outpt_medicaid_wrvu"] / stats["outpt_medicaid_pts"]
         if stats["outpt_medicaid_pts"] > 0
@@ -278,39 +713,375 @@ def _calc_stats(df, partitions):
     )
 
     # Inpatient stats
-    stats["inpt_num_pts"] = len(partitions["inpt_encs"].groupby(["date", "mrn"]))
-    stats["inpt_ttl_wrvu"] = partitions["inpt_all"].wrvu.sum()
+    stats["inpt_num_pts"] = count("inpt_pts")
+    stats["inpt_ttl_wrvu"] = totals.inpt_wrvu
 
     return stats
 
 
-# Use allow_output_mutation to avoid hashing return value to improve performance
-@st.cache_data(show_spinner=False, ttl=None, persist="disk")
-def initialize(filename_or_urls: list[str]) -> RvuData:
-    """Main entry point: retrieve file, src, and parse into DataFrame"""
-    if filename_or_urls is None:
-        return None
+def is_url(filename_or_url: str) -> bool:
+    return filename_or_url.lower().startswith("http")
 
-    # Fetch all files
-    df = pd.DataFrame()
+
+def _load_file(
+    filename_or_url: str, parse_pool: concurrent.futures.Executor = None
+) -> pd.DataFrame:
+    """Fetch and parse one file (or reuse cached copy), tagging each row with its source file"""
+    # URLs are downloaded to (or revalidated against) a local copy first
+    path = filename_or_url
+    if is_url(filename_or_url):
+        path = fetch.get(filename_or_url)
+    df = parse_cache.get_df_from_path(path, parse_pool)
+
+    if df is not None:
+        df["source"] = filename_or_url
+    return df
+
+
+# Start parse workers from a clean server process where supported (Linux, macOS), otherwise spawn them
+_WORKER_START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+def _load(filename_or_urls: list[str]) -> pd.DataFrame:
+    """Fetch and parse files into a single DataFrame, tagging each row with its source file"""
+    if INGEST_WORKERS <= 1 or len(filename_or_urls) <= 1:
+        segments = [_load_file(f) for f in filename_or_urls]
+    else:
+        # Fetch files and read cached copies in threads. Parsers are CPU bound, so files
+        # that need to be parsed are handed off to worker processes. Workers aren't forked from
+        # this process, which runs the server's threads and the refresh thread, because a
+        # forked child can deadlock on a lock held by another thread.
+        with concurrent.futures.ThreadPoolExecutor(
+            INGEST_WORKERS
+        ) as fetch_pool, concurrent.futures.ProcessPoolExecutor(
+            INGEST_WORKERS, mp_context=multiprocessing.get_context(_WORKER_START_METHOD)
+        ) as parse_pool:
+            segments = list(
+                fetch_pool.map(lambda f: _load_file(f, parse_pool), filename_or_urls)
+            )
+
+    # Concatenate once rather than growing a DataFrame one file at a time
+    segments = [df for df in segments if df is not None]
+    return pd.concat(segments) if segments else pd.DataFrame()
+
+
+def _file_mtime(filename_or_url: str) -> float:
+    """Modification time of a file, or of the local copy of a URL. 0 if it doesn't exist."""
+    try:
+        return os.stat(
+            fetch.local_path(filename_or_url)
+            if is_url(filename_or_url)
+            else filename_or_url
+        ).st_mtime
+    except OSError:
+        return 0
+
+
+def _read_sources(
+    df: pd.DataFrame, filename_or_urls: list[str]
+) -> dict[str, SourceFile]:
+    """Details of each file read into df, before duplicates are dropped"""
+    rows = df.groupby("source", observed=True).indices if len(df.index) > 0 else {}
+    posted = _day_numbers(df.posted_date) if len(df.index) > 0 else None
+    sources = {}
     for f in filename_or_urls:
-        # Read source data
-        byts = _fetch_file_or_url(f)
+        days = posted[rows[f]] if f in rows else np.empty(0, dtype=np.int64)
+        days = days[days > np.iinfo(np.int64).min]
+        sources[f] = SourceFile(
+            mtime=_file_mtime(f),
+            rows=len(rows[f]) if f in rows else 0,
+            start_day=int(days.min()) if len(days) > 0 else np.iinfo(np.int64).max,
+            end_day=int(days.max()) if len(days) > 0 else np.iinfo(np.int64).min,
+        )
+    return sources
 
-        # Detect file type, convert to DataFrame, and append
-        df_segment = data_parser.get_df(f, byts)
-        if df_segment is not None:
-            df = pd.concat([df, df_segment])
+
+def _row_keys(df: pd.DataFrame) -> np.ndarray:
+    """
+    Hash the source columns (data_parser.COLUMN_NAMES) of each row, so the same charge read from two files
+    has the same key. Identical rows in one file are numbered, so if a file lists a charge twice, both are
+    kept unless another file lists it twice too.
+    """
+    if len(df.index) == 0:
+        return np.empty(0, dtype=np.uint64)
+    # Hash each value as text (see _text_codes), so keys don't depend on the types a file was read with,
+    # e.g. numbers from Excel or dates with a different resolution. Text is hashed once per unique value.
+    columns = {}
+    for name in data_parser.COLUMN_NAMES:
+        codes, text = _text_codes(df[name])
+        # Missing values (code -1) take the last entry
+        columns[name] = np.append(pd.util.hash_array(text), np.uint64(0))[codes]
+    hashes = pd.util.hash_pandas_object(pd.DataFrame(columns), index=False).to_numpy()
+    occurrence = (
+        pd.Series(hashes)
+        .groupby([df.source.array.codes, hashes], sort=False)
+        .cumcount()
+        .to_numpy()
+    )
+    return hashes + occurrence.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+
+
+def _precedence(files: list[str], sources: dict[str, SourceFile]) -> list[str]:
+    """Files in the order their rows are kept when the same charge is in more than one file (see DEDUP)"""
+    if DEDUP == "newest":
+        return sorted(files, key=lambda f: sources[f].mtime, reverse=True)
+    return list(files)
+
+
+def _source_ranks(df: pd.DataFrame, order: list[str]) -> np.ndarray:
+    """Position in order of each row's source file"""
+    if len(df.index) == 0:
+        return np.empty(0, dtype=np.int64)
+    source = df.source.array
+    rank = {f: i for i, f in enumerate(order)}
+    return np.array(
+        [rank.get(f, len(order)) for f in source.categories], dtype=np.int64
+    )[source.codes]
+
+
+def _find_duplicates(
+    keys: np.ndarray,
+    ranks: np.ndarray,
+    posted: np.ndarray,
+    order: list[str],
+    sources: dict[str, SourceFile],
+) -> np.ndarray:
+    """
+    Find rows that were also read from a file earlier in order, e.g. from exports of overlapping date ranges.
+    Takes each row's key from _row_keys(), source file rank from _source_ranks(), and posted day number.
+    Returns a mask of rows to drop. With DEDUP = "newest", rows are also dropped if a newer file covers
+    their posted date, so a new export replaces older ones for its dates even where charges were corrected.
+    """
+    drop = np.zeros(len(keys), dtype=bool)
+    if DEDUP == "newest" and len(order) > 1:
+        mtimes = np.array([sources[f].mtime for f in order])[ranks]
+        for f in order:
+            source = sources[f]
+            if source.start_day <= source.end_day:
+                drop |= (
+                    (mtimes < source.mtime)
+                    & (posted >= source.start_day)
+                    & (posted <= source.end_day)
+                )
+    # Of rows with the same key, keep the one from the first file
+    by_rank = np.argsort(ranks, kind="stable")
+    drop[by_rank] |= pd.Series(keys[by_rank]).duplicated().to_numpy()
+    return drop
+
+
+def _count_duplicates(
+    drop: np.ndarray,
+    ranks: np.ndarray,
+    order: list[str],
+    sources: dict[str, SourceFile],
+) -> dict[str, SourceFile]:
+    """Add dropped rows to each file's count of duplicates"""
+    counts = np.bincount(ranks[drop], minlength=len(order))
+    rank = {f: i for i, f in enumerate(order)}
+    return {
+        f: dataclasses.replace(
+            source, duplicates=source.duplicates + int(counts[rank[f]])
+        )
+        for f, source in sources.items()
+    }
+
+
+def check_upload(path: str, fname: str) -> UploadCheck:
+    """
+    Parse an uploaded file saved at path, which will be moved to fname if it is accepted. Parsed data
+    for accepted files is cached under fname, so the next refresh of the data set doesn't parse the file
+    again. Rejected files are not cached, which would replace the cache entry of an existing file.
+    """
+    check = UploadCheck(name=os.path.basename(fname))
+    try:
+        with perf.span("check_upload") as span:
+            df = parse_cache.get_df_from_path(path, fname=fname, save=False)
+            span.rows = 0 if df is None else len(df.index)
+    except Exception as e:
+        logging.warning(f"Could not parse uploaded file {fname}", exc_info=True)
+        check.error = f"Could not read file: {e}"
+        return check
+
+    if df is None:
+        check.error = "Unsupported file type. Upload an Epic print (.txt) or Greenway export (.xls)."
+        return check
+    check.rows = len(df.index)
+    if check.rows == 0:
+        check.error = "No charges found in file"
+        return check
+
+    posted = df.posted_date.dropna()
+    if len(posted.index) > 0:
+        check.start_date, check.end_date = posted.min().date(), posted.max().date()
+    providers = df.provider.dropna().unique()
+    check.unknown_providers = sorted(p for p in providers if p not in PROVIDER_TO_ALIAS)
+    parse_cache.put(path, df, fname=fname)
+    return check
+
+
+# Most recently built data set in this process. Used by initialize() to apply only the
+# files that changed since the last build instead of reading every file again.
+_latest: RvuData = None
+
+
+def update(
+    rvudata: RvuData, added: list[str], removed: list[str]
+) -> typing.Optional[RvuData]:
+    """
+    Incrementally update a data set: drop rows read from removed files, then parse only
+    the added files and append their rows, except charges already read from another file.
+    Files that were overwritten in place should be listed in both added and removed.
+    """
+    global _latest
+    if rvudata is None:
+        _latest = _build(added)
+        return _latest
+    if not added and not removed:
+        return rvudata
+
+    # Rows dropped as duplicates may have been kept from a removed file instead, so files with
+    # dropped rows are read again to bring those rows back
+    removed = set(removed or [])
+    added = list(added)
+    if removed:
+        reread = [
+            f
+            for f in rvudata.files
+            if f not in removed and f not in added and rvudata.sources[f].duplicates > 0
+        ]
+        added += reread
+        removed.update(reread)
+    files = [f for f in rvudata.files if f not in removed or f in added]
+    files += [f for f in added if f not in files]
+
+    # Parse new files and calculate columns only for the new rows
+    with perf.span("load", files=len(added)) as span:
+        delta = _load(added)
+        span.rows = len(delta.index)
+    if len(delta.index) > 0:
+        with perf.span("calc_columns", rows=len(delta.index)):
+            delta = _calc_columns(delta)
+
+    # Find duplicates among the new rows and the rows that are kept. Only the new rows are hashed.
+    df = rvudata.df
+    keep = ~df.source.isin(removed).to_numpy()
+    with perf.span("dedup", rows=len(delta.index)) as span:
+        sources = {f: rvudata.sources[f] for f in files if f not in added}
+        sources.update(_read_sources(delta, added))
+        delta_keys = _row_keys(delta)
+        order = _precedence(files, sources)
+        ranks = np.concatenate(
+            [_source_ranks(df, order)[keep], _source_ranks(delta, order)]
+        )
+        posted = _day_numbers(df.posted_date)[keep]
+        if len(delta.index) > 0:
+            posted = np.concatenate([posted, _day_numbers(delta.posted_date)])
+        row_keys = np.concatenate([rvudata.row_keys[keep], delta_keys])
+        drop = _find_duplicates(row_keys, ranks, posted, order, sources)
+        sources = _count_duplicates(drop, ranks, order, sources)
+        span.fields["duplicates"] = int(drop.sum())
+        if drop.any():
+            logging.info(f"Dropped {drop.sum()} duplicate rows")
+        nkept = int(keep.sum())
+        keep[keep] = ~drop[:nkept]
+        if drop[nkept:].any():
+            delta, delta_keys = delta[~drop[nkept:]], delta_keys[~drop[nkept:]]
+
+    # Drop rows from removed files and duplicates
+    by_provider = dict(rvudata.by_provider)
+    date_index = dict(rvudata.date_index)
+    daily = dict(rvudata.daily)
+    changed = set()
+    if not keep.all():
+        df = df[keep]
+        # Row positions after the removed rows shift down. Providers without removed rows stay sorted.
+        new_rows = np.cumsum(keep) - 1
+        for alias, rows in by_provider.items():
+            kept = keep[rows]
+            if not kept.all():
+                changed.add(alias)
+            by_provider[alias] = new_rows[rows[kept]]
+
+    # Append new rows
+    if len(delta.index) > 0:
+        offset = len(df.index)
+        df = _concat([df, delta])
+        for alias, rows in _provider_rows(delta).items():
+            if len(rows) > 0:
+                by_provider[alias] = np.concatenate([by_provider[alias], rows + offset])
+                changed.add(alias)
+
+    # Only indexes and daily metrics for providers with changed data are rebuilt
+    with perf.span("index_providers", providers=len(changed)):
+        _index_providers(df, by_provider, date_index, daily, changed)
+
+    if len(df.index) == 0:
+        _latest = None
+        return None
+
+    # Date bounds only need a full scan if rows were removed
+    if not keep.all() or len(delta.index) == 0:
+        start_date, end_date = df.posted_date.min(), df.posted_date.max()
+    else:
+        start_date = min(rvudata.start_date, delta.posted_date.min())
+        end_date = max(rvudata.end_date, delta.posted_date.max())
+
+    _latest = RvuData(
+        df=df,
+        start_date=start_date,
+        end_date=end_date,
+        by_provider=by_provider,
+        date_index=date_index,
+        daily=daily,
+        files=files,
+        sources=sources,
+        row_keys=np.concatenate([rvudata.row_keys[keep], delta_keys]),
+        version=uuid.uuid4().hex,
+    )
+    return _latest
+
+
+def _build(filename_or_urls: list[str]) -> typing.Optional[RvuData]:
+    """Read all files and build a new data set"""
+    # Fetch all files
+    with perf.span("load", files=len(filename_or_urls)) as span:
+        df = _load(filename_or_urls)
+        span.rows = len(df.index)
 
     # Check if for no data available
     if len(df.index) == 0:
         return None
 
     # Add calculated columns like month/quarter, medicaid, and inpatient
-    df = _calc_columns(df)
+    with perf.span("calc_columns", rows=len(df.index)):
+        df = _calc_columns(df)
+
+    # Drop charges that were read from more than one file
+    with perf.span("dedup", rows=len(df.index)) as span:
+        files = list(filename_or_urls)
+        sources = _read_sources(df, files)
+        row_keys = _row_keys(df)
+        order = _precedence(files, sources)
+        ranks = _source_ranks(df, order)
+        drop = _find_duplicates(
+            row_keys, ranks, _day_numbers(df.posted_date), order, sources
+        )
+        sources = _count_duplicates(drop, ranks, order, sources)
+        span.fields["duplicates"] = int(drop.sum())
+        if drop.any():
+            logging.info(f"Dropped {drop.sum()} duplicate rows")
+            df, row_keys = df[~drop], row_keys[~drop]
 
-    # Split into datasets for each provider
-    by_provider = _split_by(df, "alias")
+    # Find each provider's rows, sorted and indexed by date, and precalculate daily metrics
+    with perf.span("index_providers", rows=len(df.index)):
+        by_provider = _provider_rows(df)
+        date_index, daily = {}, {}
+        _index_providers(df, by_provider, date_index, daily, list(by_provider.keys()))
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        # The report pickles each column, so only build it if it will be logged
+        logging.info("Data set memory use:\n" + memory_report(df).to_string())
 
     # Return data
     return RvuData(
@@ -318,38 +1089,169 @@ def initialize(filename_or_urls: list[str]) -> RvuData:
         start_date=df.posted_date.min(),
         end_date=df.posted_date.max(),
         by_provider=by_provider,
+        date_index=date_index,
+        daily=daily,
+        files=files,
+        sources=sources,
+        row_keys=row_keys,
+        version=uuid.uuid4().hex,
+    )
+
+
+def _load_stored(store_key: str) -> typing.Optional[RvuData]:
+    """Data set saved by _save_stored() in this or another process, with df memory mapped from disk"""
+    with perf.span("load_store") as span:
+        stored = store.load(store_key)
+        span.fields["found"] = stored is not None
+    if stored is None:
+        return None
+    df, rvudata = stored
+    return dataclasses.replace(rvudata, df=df)
+
+
+def _store_key(filename_or_urls: list[str]) -> str:
+    """
+    Key of the stored data set for a list of files. URLs are keyed by their local copy. Includes the
+    provider alias file, since aliases are indexed when the data set is built.
+    """
+    return store.key(
+        [PROVIDERS_FILE]
+        + [fetch.local_path(f) if is_url(f) else f for f in filename_or_urls]
     )
 
 
+def is_stored(filename_or_urls: list[str]) -> bool:
+    """True if the data set for these files is in the store, so other processes can open it"""
+    return store.exists(_store_key(filename_or_urls))
+
+
+def _save_stored(store_key: str, rvudata: RvuData) -> None:
+    if rvudata is None:
+        return
+    with perf.span("save_store", rows=len(rvudata.df.index)):
+        try:
+            store.save(store_key, rvudata.df, dataclasses.replace(rvudata, df=None))
+        except Exception:
+            logging.error(
+                "Could not store data set. Each server process will build its own copy.",
+                exc_info=True,
+            )
+
+
+def initialize(filename_or_urls: list[str], changed: list[str] = None) -> RvuData:
+    """
+    Main entry point: retrieve file, src, and parse into DataFrame. Files in changed were replaced since
+    the last call and are read again. Called by refresh.py in the background, which shares the result with
+    all sessions, so it must not be modified.
+    """
+    global _latest
+    if filename_or_urls is None:
+        return None
+    changed = changed or []
+
+    # Use the data set if it was already prepared by another server process or before a restart.
+    # Otherwise prepare it and store it for the other processes.
+    store_key = _store_key(filename_or_urls)
+    rvudata = _load_stored(store_key)
+    if rvudata is None:
+        if _latest is not None:
+            # If a data set was already built in this process, only read files that were added or
+            # changed, or remove rows from files that are no longer listed
+            added = [
+                f for f in filename_or_urls if f not in _latest.files or f in changed
+            ]
+            removed = [
+                f for f in _latest.files if f not in filename_or_urls or f in changed
+            ]
+            rvudata = update(_latest, added, removed)
+        else:
+            rvudata = _build(filename_or_urls)
+        _save_stored(store_key, rvudata)
+
+    _latest = rvudata
+    return _latest
+
+
+def _sizeof_filtered(filtered: typing.Union[FilteredRvuData, GroupRvuData]) -> int:
+    """Approximate memory used by a FilteredRvuData or GroupRvuData, not including the full data set it references"""
+    if filtered is None:
+        return 0
+    if isinstance(filtered, GroupRvuData):
+        frames = [filtered.stats] + list(filtered.charts.values())
+    else:
+        frames = (
+            [filtered.df]
+            + list(filtered.partitions.values())
+            + list(filtered.charts.values())
+        )
+    return int(sum(df.memory_usage(index=True, deep=True).sum() for df in frames))
+
+
+# Results of process() shared by all sessions, keyed by data set version, provider and date range
+_processed = lru.LruCache(PROCESS_CACHE_MB * 1024 * 1024, _sizeof_filtered)
+
+
 def process(
     rvudata: RvuData, provider: str, start_date: dt.date, end_date: dt.date
 ) -> FilteredRvuData:
-    """Process data that was returned by fetch(...) in partitions and calculate stats"""
-    # Get master data set for this provider. Param, provider, is the short name
-    # that is selected by the user. Use dict to translate to actual name in data.
-
+    """
+    Process data that was returned by fetch(...) in partitions and calculate stats.
+    Results for recently used providers and date ranges are returned from cache.
+    """
     if provider not in KNOWN_PROVIDER or start_date is None:
         return None
-    df = rvudata.by_provider.get(provider)
+
+    key = (rvudata.version, provider, start_date, end_date)
+    with perf.span("process", provider=provider) as span:
+        filtered = _processed.get(key)
+        span.fields["cached"] = filtered is not None
+        if filtered is None:
+            filtered = _process(rvudata, provider, start_date, end_date)
+            # Don't hold a reference to the full data set, which is replaced when data files change
+            _processed.put(key, dataclasses.replace(filtered, all=None))
+        else:
+            filtered = dataclasses.replace(filtered, all=rvudata)
+        span.rows = len(filtered.df.index)
+    return filtered
+
+
+def _process(
+    rvudata: RvuData, provider: str, start_date: dt.date, end_date: dt.date
+) -> FilteredRvuData:
+    """Filter data by provider and date range, then partition it and calculate stats"""
+    # Get rows of the master data set for this provider. Param, provider, is the short name
+    # that is selected by the user.
+    provider_rows = rvudata.by_provider[provider]
 
     # Filter data by given start and end dates for either including transactions with visit date or posting date in range
-    dt = df["date"].dt.date
-    post_dt = df["posted_date"].dt.date
-    if start_date and end_date:
-        next_day = end_date + pd.Timedelta(days=1)
-        df = df[
-            ((dt >= start_date) & (dt < next_day))
-            | ((post_dt >= start_date) & (post_dt < next_day))
-        ]
-    elif start_date:
-        df = df[(dt >= start_date) | (post_dt.date >= start_date)]
-    elif end_date:
-        next_day = end_date + pd.Timedelta(days=1)
-        df = df[(dt < next_day) | (post_dt < next_day)]
+    start, end = _day_range(start_date, end_date)
+    with perf.span("select_dates") as span:
+        visit_start, visit_end, posted_rows = _date_rows(
+            rvudata.date_index[provider], start, end
+        )
+        rows = np.concatenate([np.arange(visit_start, visit_end), posted_rows])
+        rows.sort()
+        df = rvudata.df.iloc[provider_rows[rows]]
+        span.rows = len(df.index)
+
+    # Parition data for viewing
+    with perf.span("partitions", rows=len(df.index)):
+        partitions = _calc_partitions(df)
 
-    # Parition data for viewing and calculate stats
-    partitions = _calc_partitions(df)
-    stats = _calc_stats(df, partitions)
+    # Stats are totals from the provider's daily metrics for visit dates in range, plus the
+    # few transactions outside the range that were included because of their posted date
+    with perf.span("stats", rows=len(posted_rows)):
+        totals, first_day, last_day = _cube_totals(rvudata.daily[provider], start, end)
+        late = _calc_metrics(rvudata.df.iloc[provider_rows[posted_rows]])
+        late_days = late.index[late.index > np.iinfo(np.int64).min]
+        if len(late_days) > 0:
+            first_day = min(d for d in (first_day, late_days.min()) if d is not None)
+            last_day = max(d for d in (last_day, late_days.max()) if d is not None)
+        stats = _calc_stats(totals + late.sum(), first_day, last_day)
+
+    # Series for charts
+    with perf.span("charts", rows=len(df.index)):
+        charts = _calc_charts(df, start_date, end_date)
 
     return FilteredRvuData(
         provider=provider,
@@ -359,46 +1261,309 @@ def process(
         df=df,
         partitions=partitions,
         stats=stats,
+        charts=charts,
+    )
+
+
+def process_all(
+    rvudata: RvuData, start_date: dt.date, end_date: dt.date
+) -> GroupRvuData:
+    """
+    Calculate stats for all providers at once for the All providers view. Results are cached
+    with the results of process().
+    """
+    if rvudata is None or start_date is None:
+        return None
+
+    key = (rvudata.version, ALL_PROVIDERS, start_date, end_date)
+    with perf.span("process_all") as span:
+        group = _processed.get(key)
+        span.fields["cached"] = group is not None
+        if group is None:
+            group = _process_all(rvudata, start_date, end_date)
+            _processed.put(key, group)
+    return group
+
+
+def _process_all(
+    rvudata: RvuData, start_date: dt.date, end_date: dt.date
+) -> GroupRvuData:
+    # Same transactions as process(): visit date or posted date in range
+    start, end = _day_range(start_date, end_date)
+    day = _day_numbers(rvudata.df.date)
+    posted_day = _day_numbers(rvudata.df.posted_date)
+    in_range = ((day >= start) & (day <= end)) | (
+        (posted_day >= start) & (posted_day <= end)
+    )
+    df = rvudata.df[in_range]
+
+    # Metrics per provider and visit date in one grouped pass. The totals for each provider are the
+    # same as process() gets from its daily metrics and transactions included by posted date.
+    with perf.span("metrics", rows=len(df.index)):
+        metrics = _calc_metrics(df, keys=["alias"])
+    stats = {}
+    for alias, provider_metrics in metrics.groupby(level="alias"):
+        days = provider_metrics.index.get_level_values("day")
+        days = days[days > np.iinfo(np.int64).min]
+        stats[alias] = _calc_stats(
+            provider_metrics.sum(),
+            days.min() if len(days) > 0 else None,
+            days.max() if len(days) > 0 else None,
+        )
+    stats = pd.DataFrame.from_dict(stats, orient="index")
+
+    # Encounters by visit month, only for visit dates in range, and wRVUs by posted month, excluding
+    # charges posted after the range. Same as the single provider charts (see _calc_charts()).
+    visits = metrics.encs.reset_index()
+    visits = visits[(visits.day >= start) & (visits.day <= end)]
+    months = (
+        pd.to_datetime(visits.day.to_numpy().astype("datetime64[D]"))
+        .to_period("M")
+        .strftime("%Y-%m")
+    )
+    enc_by_month = (
+        visits.encs.groupby([visits.alias.to_numpy(), months]).sum().reset_index()
+    )
+    enc_by_month.columns = ["Provider", "Month", "Encounters"]
+
+    posted = df[
+        (posted_day[in_range] > np.iinfo(np.int64).min) & (posted_day[in_range] <= end)
+    ]
+    rvu_by_month = (
+        posted.groupby(["alias", "posted_month"], observed=True)
+        .wrvu.sum()
+        .reset_index()
+    )
+    rvu_by_month.columns = ["Provider", "Month", "wRVUs"]
+
+    return GroupRvuData(
+        start_date=start_date,
+        end_date=end_date,
+        stats=stats,
+        charts={"enc_by_month": enc_by_month, "rvu_by_month": rvu_by_month},
     )
 
 
+def find_rows(
+    df: pd.DataFrame, search: str = None, sort_by: str = None, descending: bool = False
+) -> np.ndarray:
+    """
+    Return positions of rows in df with any text column containing search (case insensitive),
+    ordered by the sort_by column if given. Used to page through large data sets on the server.
+    """
+    match = np.ones(len(df.index), dtype=bool)
+    if search:
+        match[:] = False
+        for column in df.columns:
+            values = df[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # Only search each category once
+                found = values.cat.categories.astype(str).str.contains(
+                    search, case=False, regex=False
+                )
+                match |= np.isin(values.cat.codes.to_numpy(), np.flatnonzero(found))
+            elif pd.api.types.is_string_dtype(values):
+                match |= values.str.contains(
+                    search, case=False, regex=False, na=False
+                ).to_numpy(dtype=bool)
+    rows = np.flatnonzero(match)
+
+    if sort_by:
+        values = df[sort_by].iloc[rows].reset_index(drop=True)
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Categories are in order of appearance, so sort them for display
+            values = values.cat.reorder_categories(
+                sorted(values.cat.categories, key=str)
+            )
+        order = values.sort_values(ascending=not descending, kind="stable").index
+        rows = rows[order.to_numpy()]
+
+    return rows
+
+
+def _text_codes(values: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Unique values as stripped strings, so MRNs and codes compare equal whether they were read as text
+    or numbers (e.g. 1234.0 from Excel), and the position of each row's value in them (-1 if missing)
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    text = pd.Series(np.asarray(uniques, dtype=object)).astype(str).str.strip()
+    return codes, text.str.replace(r"\.0$", "", regex=True).to_numpy(dtype=object)
+
+
+def _as_text(values: pd.Series) -> np.ndarray:
+    """Values as text (see _text_codes), or None if missing"""
+    codes, text = _text_codes(values)
+    return np.append(text, None)[codes]
+
+
+def _as_numbers(values: pd.Series) -> np.ndarray:
+    """Amounts as numbers, e.g. "1,234.00" read as text. NaN if missing or not a number. Each unique value is converted once."""
+    codes, uniques = pd.factorize(values)
+    text = (
+        pd.Series(np.asarray(uniques, dtype=object))
+        .astype(str)
+        .str.replace(",", "", regex=False)
+    )
+    return np.append(
+        pd.to_numeric(text, errors="coerce").to_numpy(dtype=float), np.nan
+    )[codes]
+
+
+def _visit_hashes(date: pd.Series, mrn: pd.Series, cpt: pd.Series = None) -> np.ndarray:
+    """Hash visit date, MRN, and optionally CPT of each row. Text is hashed once per unique value."""
+    hashes = pd.util.hash_array(_day_numbers(date))
+    for values in [mrn] if cpt is None else [mrn, cpt]:
+        codes, text = _text_codes(values)
+        # Missing values (code -1) take the last entry
+        text_hashes = np.append(pd.util.hash_array(text), np.uint64(0))
+        hashes = hashes * np.uint64(1000003) ^ text_hashes[codes]
+    return hashes
+
+
+def _build_visit_index(df: pd.DataFrame, rows: np.ndarray) -> VisitIndex:
+    provider_df = df.iloc[rows]
+    charge = _visit_hashes(provider_df.date, provider_df.mrn, provider_df.cpt)
+    visit = _visit_hashes(provider_df.date, provider_df.mrn)
+    charge_order = np.argsort(charge, kind="stable")
+    visit_order = np.argsort(visit, kind="stable")
+    return VisitIndex(
+        charge=charge[charge_order],
+        charge_rows=rows[charge_order],
+        visit=visit[visit_order],
+        visit_rows=rows[visit_order],
+    )
+
+
+def _lookup(
+    keys: np.ndarray, index: np.ndarray, rows: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Find all rows matching each key by binary search of a sorted hash index. Returns pairs of
+    arrays: position in keys, and matching row position, in order of keys then rows.
+    """
+    lo = np.searchsorted(index, keys, side="left")
+    counts = np.searchsorted(index, keys, side="right") - lo
+    which = np.repeat(np.arange(len(keys)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return which, rows[np.repeat(lo, counts) + offsets]
+
+
+def _sizeof_visit_data(value: typing.Union[VisitIndex, VisitLogData]) -> int:
+    """Approximate memory used by a VisitIndex or VisitLogData, not including the data set it references"""
+    if isinstance(value, VisitIndex):
+        return sum(a.nbytes for a in dataclasses.astuple(value))
+    frames = [value.visit_log_df, value.validated, value.diff]
+    return int(sum(df.memory_usage(index=True, deep=True).sum() for df in frames))
+
+
+# Visit indexes keyed by data set version and provider, and validation results keyed by data set
+# version, provider, and hash of the visit log
+_visit_indexes = lru.LruCache(VALIDATE_CACHE_MB * 1024 * 1024, _sizeof_visit_data)
+_validated = lru.LruCache(VALIDATE_CACHE_MB * 1024 * 1024, _sizeof_visit_data)
+
+
 def validate_visits(
     rvudata: FilteredRvuData, visit_log_bytes: typing.ByteString
 ) -> VisitLogData:
-    """Validate the entries in a visit log against the charges in the rvu data"""
+    """
+    Validate the entries in a visit log against the charges in the rvu data. Results for the
+    same log, provider, and data set are returned from cache.
+    """
     if rvudata is None or visit_log_bytes is None:
         return None
 
+    key = (
+        rvudata.all.version,
+        rvudata.provider,
+        hashlib.sha256(visit_log_bytes).hexdigest(),
+    )
+    with perf.span("validate_visits", provider=rvudata.provider) as span:
+        visit_data = _validated.get(key)
+        span.fields["cached"] = visit_data is not None
+        if visit_data is None:
+            visit_data = _validate_visits(rvudata, visit_log_bytes)
+            _validated.put(key, dataclasses.replace(visit_data, df=None))
+        else:
+            visit_data = dataclasses.replace(visit_data, df=rvudata.df)
+        span.rows = len(visit_data.visit_log_df.index)
+    return visit_data
+
+
+def _validate_visits(
+    rvudata: FilteredRvuData, visit_log_bytes: typing.ByteString
+) -> VisitLogData:
     # Read visit log as CSV
     visit_log_df = pd.read_csv(
         io.BytesIO(visit_log_bytes),
         names=["date", "mrn", "docid", "cpt"],
-        dtype={"cpt": str},
+        dtype={"mrn": str, "cpt": str},
     )
     visit_log_df.date = pd.to_datetime(visit_log_df.date, errors="coerce")
     # Drop duplicates by docid
     visit_log_df = visit_log_df.groupby("docid").last()
 
-    # Source RVU data - limited to selected provider and dates
-    df = rvudata.all.by_provider.get(rvudata.provider)
+    # Hash index of the provider's charges, built once per data set
+    df = rvudata.all.df
+    index_key = (rvudata.all.version, rvudata.provider)
+    index = _visit_indexes.get(index_key)
+    if index is None:
+        provider_rows = rvudata.all.by_provider[rvudata.provider]
+        with perf.span("build_visit_index", rows=len(provider_rows)):
+            index = _build_visit_index(df, provider_rows)
+        _visit_indexes.put(index_key, index)
 
-    # Find rows in visit log that have the same date, MRN, and code in the RVU data
-    joined = pd.merge(
-        visit_log_df[["date", "mrn", "cpt"]],
-        df,
-        on=["date", "mrn", "cpt"],
-        how="left",
-        suffixes=["_log", "_actual"],
+    # Look up charges with the same date, MRN, and code, and charges for the same visit (date and MRN)
+    log = visit_log_df[["date", "mrn", "cpt"]].reset_index(drop=True)
+    log_charges, charge_rows = _lookup(
+        _visit_hashes(log.date, log.mrn, log.cpt), index.charge, index.charge_rows
+    )
+    log_visits, visit_rows = _lookup(
+        _visit_hashes(log.date, log.mrn), index.visit, index.visit_rows
     )
 
-    # First keep rows that have a matching RVU data entry
-    validated = joined[~joined.posted_date.isna()]
+    # Confirm matches, in case of hash collisions
+    def same(log_pos, rows, columns):
+        matched = np.ones(len(rows), dtype=bool)
+        for column in columns:
+            actual, logged = df[column].iloc[rows], log[column].iloc[log_pos]
+            if column == "date":
+                matched &= _day_numbers(actual) == _day_numbers(logged)
+            else:
+                matched &= _as_text(actual) == _as_text(logged)
+        return matched
 
-    # Process rows that don't have matching data
-    diff = joined[joined.posted_date.isna()]
-    diff = diff[["date", "mrn", "cpt"]]
+    matched = same(log_charges, charge_rows, ["date", "mrn", "cpt"])
+    log_charges, charge_rows = log_charges[matched], charge_rows[matched]
+    matched = same(log_visits, visit_rows, ["date", "mrn"])
+    log_visits, visit_rows = log_visits[matched], visit_rows[matched]
+
+    # Keep rows that have a matching RVU data entry, with the log's values for matched columns
+    validated = df.iloc[charge_rows].reset_index(drop=True)
+    validated = pd.concat(
+        [
+            log.iloc[log_charges].reset_index(drop=True),
+            validated.drop(columns=["date", "mrn", "cpt"]),
+        ],
+        axis=1,
+    )
+
+    # Rows that don't have matching data, with any codes billed for the same visit
+    unmatched = np.setdiff1d(np.arange(len(log.index)), log_charges)
+    near = np.isin(log_visits, unmatched)
+    billed = (
+        pd.Series(_as_text(df.cpt.iloc[visit_rows[near]]), index=log_visits[near])
+        .dropna()
+        .groupby(level=0)
+        .agg(lambda codes: ", ".join(sorted(set(codes))))
+    )
+    diff = log.iloc[unmatched].copy()
+    diff["billed_cpt"] = billed.reindex(unmatched).to_numpy()
     diff = diff.drop_duplicates()
 
     return VisitLogData(
-        visit_log_df=visit_log_df, df=df, validated=validated, diff=diff
+        visit_log_df=visit_log_df, df=rvudata.df, validated=validated, diff=diff
     )
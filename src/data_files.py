@@ -1,35 +1,93 @@
 import os
+import re
+import uuid
+import shutil
+import typing
 
 # Location of data files: rvu-dash/data/
 BASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+# Location of files derived from data files, like parsed data: rvu-dash/cache/
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache")
+# Uploads are written to a temp file in the data dir with this prefix until they are checked
+UPLOAD_PREFIX = ".upload-"
+# Bytes copied at a time when saving uploads
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 
 def get():
     """Return list of data files. Defaults to 'files' config var if set, otherwise list of local files"""
-    return os.environ.get("STREAMLIT_DATA_FILES") or get_local()
+    files = os.environ.get("STREAMLIT_DATA_FILES")
+    if files:
+        # Comma or whitespace separated list of files or URLs
+        return [f for f in re.split(r"[\s,]+", files) if f]
+    return get_local()
 
 
 def get_local():
-    """Return list of local data files"""
+    """Return list of local data files, excluding uploads that are still being saved"""
     if not os.path.isdir(BASE_PATH):
         return []
 
-    return [os.path.join(BASE_PATH, local) for local in os.listdir(BASE_PATH)]
+    return [
+        os.path.join(BASE_PATH, local)
+        for local in os.listdir(BASE_PATH)
+        if not local.startswith(UPLOAD_PREFIX)
+    ]
 
 
-def update_local(files, remove_existing):
+def _save_upload(file) -> str:
+    """
+    Copy an uploaded file to a temp file in the data dir in chunks, rather than making another copy of
+    it in memory. The temp file keeps the file's extension, which parsers use to detect its format.
+    """
+    tmp = os.path.join(BASE_PATH, f"{UPLOAD_PREFIX}{uuid.uuid4().hex}-{file.name}")
+    file.seek(0)
+    with open(tmp, "wb") as local:
+        shutil.copyfileobj(file, local, UPLOAD_CHUNK_SIZE)
+    return tmp
+
+
+def update_local(
+    files, remove_existing, check: typing.Callable[[str, str], typing.Any] = None
+) -> tuple[list[str], list[str], list]:
+    """
+    Save uploaded files to the data dir. Each file is written to a temp file, checked by calling
+    check(temp path, final path), and only moved into place if the result's error is not set.
+    Existing files are only removed if requested and at least one file was accepted.
+
+    Returns lists of paths that were added and removed, and the result of check() for each file.
+    Files that replaced an existing file with the same name appear in both lists.
+    """
+    added, removed, checks = [], [], []
     if files is None or len(files) == 0:
-        return
+        return added, removed, checks
 
     # Ensure base data directory exists
     os.makedirs(BASE_PATH, exist_ok=True)
 
-    # Delete all files if requested
-    if remove_existing:
-        for local in os.listdir(BASE_PATH):
-            os.remove(os.path.join(BASE_PATH, local))
-
     # Save new files to data dir
     for file in files:
-        with open(os.path.join(BASE_PATH, file.name), "wb") as local:
-            local.write(file.read())
+        path = os.path.join(BASE_PATH, os.path.basename(file.name))
+        tmp = _save_upload(file)
+        try:
+            result = check(tmp, path) if check else None
+            checks.append(result)
+            if result is not None and result.error:
+                continue
+            if os.path.exists(path):
+                removed.append(path)
+            # Readers see either the old file or the complete new one
+            os.replace(tmp, path)
+            added.append(path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    # Delete all other files if requested
+    if remove_existing and added:
+        for path in get_local():
+            if path not in added:
+                os.remove(path)
+                removed.append(path)
+
+    return added, removed, checks
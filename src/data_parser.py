@@ -1,8 +1,19 @@
 import io
+import os
+import mmap
 import logging
 import re
+import typing
+import traceback
+import numpy as np
 import pandas as pd
 
+# Increment when parsing output changes to invalidate previously cached parse results
+PARSER_VERSION = 1
+
+# Size of each chunk of an Epic print that is parsed at once. Bounds intermediate memory use.
+EPIC_CHUNK_SIZE = 32 * 1024 * 1024
+
 # Columns to use from Excel sheet and the corresponding column names
 GW_SOURCE_COLUMNS = "B,C,D,E,G,H,I,K,N,P,R,S,T"
 EPIC_COLUMN_POSITIONS = [0,12,24,50,62,62,83,164,170,178,178,187,223,264]
@@ -45,7 +56,8 @@ def _gw_excel_to_df(byts: bytes) -> pd.DataFrame:
     df = df[df.posted_date.notnull() & df.provider.notnull()]
     return df
 
-def _epic_fixedwidth_to_df(byts: bytes) -> pd.DataFrame:
+def _epic_fixedwidth_text_to_df(byts: typing.ByteString) -> pd.DataFrame:
+    """Line by line parser for Epic prints. Used when text is not plain ASCII."""
     # Convert bytes to string
     txt = str(byts, 'UTF-8')
     
@@ -60,23 +72,157 @@ def _epic_fixedwidth_to_df(byts: bytes) -> pd.DataFrame:
     positions = EPIC_COLUMN_POSITIONS
     for ln in filtered.splitlines():
         data.append(tuple(ln[pos:positions[i+1]].strip() for i, pos in enumerate(positions[:-1])))
-    df = pd.DataFrame(data, columns=COLUMN_NAMES)
+    return _epic_set_types(pd.DataFrame(data, columns=COLUMN_NAMES))
+
+def _epic_data_lines(buf: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Return start and end offsets of lines in buffer that start with a date (ie, 0 or 1, first digit of month)"""
+    newlines = np.flatnonzero(buf == ord('\n'))
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.concatenate((newlines, [len(buf)]))
+    # Drop the empty line after a trailing newline, then keep lines starting with 0 or 1
+    keep = starts < len(buf)
+    starts, ends = starts[keep], ends[keep]
+    first = buf[starts]
+    keep = (first == ord('0')) | (first == ord('1'))
+    starts, ends = starts[keep], ends[keep]
+    # Exclude carriage return from CRLF line endings
+    ends = ends - (buf[ends - 1] == ord('\r'))
+    return starts, ends
+
+def _epic_slice_column(buf: np.ndarray, starts: np.ndarray, ends: np.ndarray, col_start: int, col_end: int) -> np.ndarray:
+    """Extract one fixed width column from every line at once as a stripped array of byte strings"""
+    width = col_end - col_start
+    if width <= 0:
+        return np.full(len(starts), b'', dtype='S1')
+    # 2D array of byte offsets, one row per line. Pad lines shorter than the column with spaces.
+    offsets = starts[:, None] + np.arange(col_start, col_end)
+    chars = np.where(offsets < ends[:, None], buf[np.minimum(offsets, len(buf) - 1)], ord(' '))
+    col = np.ascontiguousarray(chars, dtype=np.uint8).view(f'S{width}').ravel()
+    return np.char.strip(col)
+
+def _epic_parse_dates(col: np.ndarray) -> np.ndarray:
+    """
+    Parse an array of MM/DD/YYYY byte strings directly from their digits. Values in any other
+    format fall back to pd.to_datetime().
+    """
+    chars = np.ascontiguousarray(col.astype('S10')).view(np.uint8).reshape(-1, 10).astype(np.int64)
+    digits = chars - ord('0')
+    is_digit = (digits >= 0) & (digits <= 9)
+    matched = is_digit[:, [0, 1, 3, 4, 6, 7, 8, 9]].all(axis=1) & (chars[:, 2] == ord('/')) & (chars[:, 5] == ord('/'))
+    month = digits[:, 0] * 10 + digits[:, 1]
+    day = digits[:, 3] * 10 + digits[:, 4]
+    year = digits[:, 6] * 1000 + digits[:, 7] * 100 + digits[:, 8] * 10 + digits[:, 9]
+    valid = matched & (month >= 1) & (month <= 12) & (day >= 1)
 
-    # Set specific column types
+    # Build dates as first of month plus days, and reject days past the end of the month
+    months = np.where(valid, (year - 1970) * 12 + month - 1, 0).astype('datetime64[M]')
+    dates = months.astype('datetime64[D]') + np.where(valid, day - 1, 0)
+    valid &= dates.astype('datetime64[M]') == months
+    dates = np.where(valid, dates, np.datetime64('NaT')).astype('datetime64[ns]')
+
+    # Parse anything that isn't blank and doesn't match the expected format the slow way
+    other = ~matched & (col != b'')
+    if other.any():
+        dates[other] = pd.to_datetime(col[other].astype(str), errors="coerce").values
+    return dates
+
+def _epic_parse_numbers(col: np.ndarray) -> np.ndarray:
+    """Convert an array of byte strings to numbers, with the same resulting type as pd.to_numeric()"""
+    for dtype in (np.int64, np.float64):
+        try:
+            return col.astype(dtype)
+        except ValueError:
+            pass
+    return pd.to_numeric(col.astype(str))
+
+def _epic_fixedwidth_to_df(byts: typing.ByteString) -> pd.DataFrame:
+    """Convert fixed width Epic print to dataframe by slicing all lines at once from a byte array"""
+    buf = np.frombuffer(byts, dtype=np.uint8)
+    if (buf >= 0x80).any():
+        # Column positions are character based. Slicing bytes is only equivalent for ASCII text.
+        return _epic_fixedwidth_text_to_df(byts)
+
+    # Column positions are defined in the Epic Report Settings > Print Layout
+    starts, ends = _epic_data_lines(buf)
+    positions = EPIC_COLUMN_POSITIONS
+    columns = {}
+    for i, name in enumerate(COLUMN_NAMES):
+        col = _epic_slice_column(buf, starts, ends, positions[i], positions[i+1])
+        if name in ("posted_date", "date"):
+            columns[name] = _epic_parse_dates(col)
+        elif name in ("units", "wrvu"):
+            columns[name] = _epic_parse_numbers(col)
+        else:
+            columns[name] = col.astype(str)
+    return _epic_set_types(pd.DataFrame(columns))
+
+def iter_epic_chunks(byts: typing.ByteString, chunk_size: int = EPIC_CHUNK_SIZE) -> typing.Iterator[pd.DataFrame]:
+    """
+    Parse an Epic print in chunks of whole lines and yield a typed DataFrame for each chunk.
+    Accepts bytes or an mmap of a file, and slices without copying, so only one chunk's
+    intermediate arrays are in memory at a time.
+    """
+    view = memoryview(byts)
+    try:
+        start = 0
+        while start < len(view):
+            end = start + chunk_size
+            if end < len(view):
+                # Extend chunk to the end of the current line
+                newline = byts.find(b'\n', end)
+                end = newline + 1 if newline >= 0 else len(view)
+            chunk = view[start:end]
+            try:
+                df = _epic_fixedwidth_to_df(chunk)
+            except Exception as e:
+                # Frames in the traceback hold arrays over the chunk, which would keep an mmap from closing
+                # and replace this error with a BufferError. Keep the traceback but drop their variables.
+                while e is not None:
+                    traceback.clear_frames(e.__traceback__)
+                    e = e.__cause__ or e.__context__
+                raise
+            finally:
+                chunk.release()
+            yield df
+            start = end
+    finally:
+        view.release()
+
+def _epic_chunked_to_df(byts: typing.ByteString) -> pd.DataFrame:
+    """Parse an Epic print chunk by chunk and concatenate the results once"""
+    chunks = list(iter_epic_chunks(byts))
+    if len(chunks) == 0:
+        return _epic_fixedwidth_to_df(b'')
+    df = pd.concat(chunks, ignore_index=True)
+    # Chunks have different CPT categories, so categorize again after combining
+    df.cpt = pd.Categorical(df.cpt)
+    return df
+
+def _epic_set_types(df: pd.DataFrame) -> pd.DataFrame:
+    """Set specific column types on parsed Epic data"""
     df.cpt = pd.Categorical(df.cpt)
     df.wrvu = pd.to_numeric(df.wrvu)
     df.units = pd.to_numeric(df.units)
     df.posted_date = pd.to_datetime(df.posted_date, errors="coerce")
     df.date = pd.to_datetime(df.date, errors="coerce")
-    
-    return df    
+    return df
 
-def get_df(fname: str, byts: bytes) -> pd.DataFrame:
-    """Main export for module. Parses a file given its filename and contents and returns a DataFrame"""
+def get_df(fname: str, byts: typing.ByteString) -> pd.DataFrame:
+    """
+    Main export for module. Parses a file given its filename and contents and returns a DataFrame.
+    Contents may be bytes or an mmap of the file.
+    """
     # Detect source file type and return appropriate parser 
     if _is_gw_source(fname, byts):
         return _gw_excel_to_df(byts)
     elif _is_epic_fixedwidth(fname, byts):
-        return _epic_fixedwidth_to_df(byts)
+        return _epic_chunked_to_df(byts)
     else:
-        return None
\ No newline at end of file
+        return None
+
+def get_df_from_path(path: str) -> pd.DataFrame:
+    """Same as get_df() for a local file, which is memory mapped rather than read into memory"""
+    if os.path.getsize(path) == 0:
+        return get_df(path, b'')
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return get_df(path, mm)
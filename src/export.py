@@ -0,0 +1,148 @@
+import os
+import typing
+import uuid
+import hashlib
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from . import data_files
+
+# Location of generated downloads: rvu-dash/cache/export/
+EXPORT_PATH = os.path.join(data_files.CACHE_PATH, "export")
+
+# Rows converted and written at a time, so large exports never hold a second full copy of the data in memory
+CHUNK_ROWS = 100_000
+
+# Excel limit, including the header row
+XLSX_MAX_ROWS = 1_048_576
+
+# Download formats: extension and mime type
+FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "Excel": (
+        "xlsx",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ),
+}
+
+
+def _chunks(df: pd.DataFrame) -> typing.Iterator[pd.DataFrame]:
+    for start in range(0, len(df.index), CHUNK_ROWS):
+        yield df.iloc[start : start + CHUNK_ROWS]
+
+
+def write_csv(df: pd.DataFrame, path: str) -> None:
+    """Write df to a CSV file in chunks of rows"""
+    with open(path, "w", newline="") as f:
+        df.iloc[:0].to_csv(f, index=False)
+        for chunk in _chunks(df):
+            chunk.to_csv(f, index=False, header=False)
+
+
+def _parquet_schema(df: pd.DataFrame) -> pa.Schema:
+    """
+    Arrow schema for df, inferred from its first chunk of rows. Object columns (all text in pandas 2) that
+    are empty in the first chunk would be typed null, so they take the type of the column's first values.
+    """
+    schema = pa.Schema.from_pandas(df.iloc[:CHUNK_ROWS], preserve_index=False)
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            values = df[field.name].dropna()
+            if len(values.index) > 0:
+                schema = schema.set(
+                    i,
+                    field.with_type(
+                        pa.Array.from_pandas(values.iloc[:CHUNK_ROWS]).type
+                    ),
+                )
+    return schema
+
+
+def write_parquet(df: pd.DataFrame, path: str) -> None:
+    """Write df to a Parquet file with one row group per chunk of rows"""
+    schema = _parquet_schema(df)
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in _chunks(df):
+            writer.write_table(
+                pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            )
+
+
+def _xlsx_values(values: pd.Series) -> list:
+    """
+    Cell values for a column: None for missing values, and dates as Excel serial day numbers, which
+    are much faster to write than datetimes and are shown as dates using the column's format
+    """
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        values = (values - pd.Timestamp("1899-12-30")) / pd.Timedelta(days=1)
+    return values.astype(object).where(values.notna(), None).tolist()
+
+
+def write_xlsx(sheets: dict[str, pd.DataFrame], path: str) -> None:
+    """
+    Write each DataFrame to its own worksheet. Uses xlsxwriter's constant memory mode, which flushes
+    each row to disk as it is written. DataFrames longer than Excel's row limit continue on more sheets.
+    """
+    import xlsxwriter
+
+    with xlsxwriter.Workbook(path, {"constant_memory": True}) as workbook:
+        date_format = workbook.add_format({"num_format": "m/d/yyyy"})
+        for name, df in sheets.items():
+            date_columns = [
+                i
+                for i, dtype in enumerate(df.dtypes)
+                if pd.api.types.is_datetime64_any_dtype(dtype)
+            ]
+            for part, start in enumerate(
+                range(0, max(len(df.index), 1), XLSX_MAX_ROWS - 1)
+            ):
+                title = name[:31] if part == 0 else f"{name[:26]} ({part + 1})"
+                sheet = workbook.add_worksheet(title)
+                sheet.write_row(0, 0, list(df.columns))
+                for i in date_columns:
+                    sheet.set_column(i, i, 10, date_format)
+
+                row = 1
+                for chunk in _chunks(df.iloc[start : start + XLSX_MAX_ROWS - 1]):
+                    for record in zip(*[_xlsx_values(chunk[c]) for c in chunk.columns]):
+                        sheet.write_row(row, 0, record)
+                        row += 1
+
+
+def _export_path(version: str, key: tuple, ext: str) -> str:
+    digest = hashlib.sha256(repr(key).encode()).hexdigest()
+    return os.path.join(EXPORT_PATH, f"{version}-{digest[:16]}.{ext}")
+
+
+def _remove_stale(version: str) -> None:
+    """Delete exports from other versions of the data set"""
+    for entry in os.listdir(EXPORT_PATH):
+        if not entry.startswith(version + "-"):
+            try:
+                os.remove(os.path.join(EXPORT_PATH, entry))
+            except OSError:
+                pass
+
+
+def get(
+    version: str, key: tuple, fmt: str, write: typing.Callable[[str], None]
+) -> bytes:
+    """
+    Return the contents of an export, calling write(path) to generate it the first time. Exports are
+    cached on disk by data set version, key (e.g. provider, date range and data set name) and format.
+    """
+    ext = FORMATS[fmt][0]
+    path = _export_path(version, key + (fmt,), ext)
+    if not os.path.isfile(path):
+        logging.info(f"Exporting {key} as {fmt}")
+        os.makedirs(EXPORT_PATH, exist_ok=True)
+        _remove_stale(version)
+        # Write to a temp file and move into place so readers never see a partial file
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        write(tmp)
+        os.replace(tmp, path)
+
+    with open(path, "rb") as f:
+        return f.read()
@@ -0,0 +1,106 @@
+import os
+import re
+import json
+import uuid
+import hashlib
+import logging
+import requests
+import urllib.parse
+from pprint import pformat
+from . import data_files
+
+# Location of downloaded copies of remote data files: rvu-dash/cache/http/
+HTTP_PATH = os.path.join(data_files.CACHE_PATH, "http")
+# Max number of open connections kept per host
+POOL_SIZE = 16
+
+_session = None
+
+
+def _get_session() -> requests.Session:
+    """Session shared by all requests so connections are reused"""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _session = session
+    return _session
+
+
+def local_path(url: str) -> str:
+    """Path to local copy of a URL. Keeps the URL's file name, which determines how it is parsed."""
+    name = os.path.basename(urllib.parse.urlparse(url).path)
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", name)
+    return os.path.join(
+        HTTP_PATH, hashlib.sha256(url.encode()).hexdigest()[:16] + "-" + name
+    )
+
+
+def _read_meta(path: str) -> dict:
+    """Validators (ETag, Last-Modified) saved with the local copy of a URL"""
+    try:
+        with open(path + ".json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def get(url: str) -> str:
+    """
+    Download a URL to the local cache and return the path to the local copy. If the URL was
+    downloaded before, make a conditional request so the body is only transferred if it changed.
+    """
+    logging.info("Fetching " + url)
+    path = local_path(url)
+
+    # Add validators from last download
+    headers = {}
+    meta = _read_meta(path) if os.path.isfile(path) else {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    with _get_session().get(
+        url, headers=headers, allow_redirects=True, stream=True
+    ) as resp:
+        logging.info(
+            "Status "
+            + str(resp.status_code)
+            + " from "
+            + resp.url
+            + "\n Headers: "
+            + pformat(resp.headers)
+        )
+        if resp.status_code == 304:
+            return path
+        resp.raise_for_status()
+
+        # Stream body to a temp file, then move into place with new validators. Temp files are unique to
+        # this writer, since other server processes may be downloading the same URL.
+        os.makedirs(HTTP_PATH, exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                for block in resp.iter_content(1024 * 1024):
+                    f.write(block)
+            os.replace(tmp, path)
+            with open(tmp, "w") as f:
+                json.dump(
+                    {
+                        "url": url,
+                        "etag": resp.headers.get("ETag"),
+                        "last_modified": resp.headers.get("Last-Modified"),
+                    },
+                    f,
+                )
+            os.replace(tmp, path + ".json")
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    return path
@@ -1,20 +1,44 @@
+import importlib
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-from st_aggrid import AgGrid, GridOptionsBuilder
+from . import perf
 
-def st_aggrid(df):
+
+class _LazyModule:
+    """Module that is only imported when one of its attributes is first used"""
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self._name), attr)
+
+
+# Plotting and grid libraries are slow to import, so they are only loaded once a chart or grid is shown
+px = _LazyModule("plotly.express")
+
+@perf.timed
+def st_aggrid(df, caption=None, paginate=True):
+    """
+    Show df in a grid. With paginate=False, df is a single page of a larger data set that was searched,
+    sorted, and paged on the server, so sorting and filtering are turned off in the browser.
+    """
+    from st_aggrid import AgGrid, GridOptionsBuilder
     gb = GridOptionsBuilder.from_dataframe(df)
     # Allow cell text selection / copy
     gb.configure_grid_options(enableCellTextSelection=True)
     gb.configure_grid_options(ensureDomOrder=True)
-    gb.configure_grid_options(pagination=True, paginationPageSize=30)
+    if paginate:
+        gb.configure_grid_options(pagination=True, paginationPageSize=30)
+    else:
+        gb.configure_default_column(sortable=False, filter=False)
     # Customize date column Truet
     gb.configure_columns(["posted_date", "date"], type=["customDateTimeFormat"], custom_format_string="M/d/yyyy")
     gb.configure_column("wrvu", type=["customNumericFormat"], precision=2)
     AgGrid(df, gridOptions=gb.build())
-    st.caption(f"{len(df)} rows")
+    st.caption(caption or f"{len(df)} rows")
 
+@perf.timed
 def st_summary(stats, start_date, end_date, ct, columns=True):
     """Render summary stats"""
     ct.write(
@@ -29,17 +53,10 @@ def st_summary(stats, start_date, end_date, ct, columns=True):
     ct3.metric("wRVU / encounter", round(stats["wrvu_per_encs"], 2))
     ct4.metric("Last Visit", stats["end_date"].strftime("%m-%d-%y"))
 
-def st_enc_by_month_fig(partitions, start_date, end_date, ct):
-    """Bar graph of number of visits"""
-    # Data was filtered on visit date or posted date. Since charges may be posted after our specified time period,
-    # remove the ones out of our period to avoid confusion for the user.
-    df = partitions["all_encs"]
-    df = df[df["date"].dt.date >= start_date]
-    df = df[df["date"].dt.date < (end_date + pd.Timedelta(days=1))]
-
-    src = df.groupby(["date", "month", "mrn"]).size().reset_index().groupby("month").count().reset_index()
-    src = src[["month", "mrn"]]
-    src.columns = ["Month", "Encounters"]
+@perf.timed
+def st_enc_by_month_fig(charts, ct):
+    """Bar graph of number of visits. Series are precalculated by data.process() (see data._calc_charts())"""
+    src = charts["enc_by_month"]
     fig = px.bar(src, title="Encounters", x="Month", y="Encounters", text="Encounters", text_auto="i")
     fig.update_layout(title_x=0.5) # Center title
     fig.update_xaxes(tickformat="%b %Y") # Make x-axis dates show only month and year
@@ -51,82 +68,82 @@ def st_enc_by_month_fig(partitions, start_date, end_date, ct):
     # src["Setting"] = src["Setting"].apply(lambda x: "Inpatient" if x else "Outpatient")
     # fig = px.bar(src, title="Encounters", x="Month", y="Encounters", color="Setting", text="Encounters", text_auto="i", hover_data={"Setting": False})
 
-def st_enc_by_quarter_fig(partitions, start_date, end_date, ct):
-    # Filter out encounters outside of time period (see comment in st_enc_by_month_fig())
-    df = partitions["all_encs"]
-    df = df[df["date"].dt.date >= start_date]
-    df = df[df["date"].dt.date < (end_date + pd.Timedelta(days=1))]
-
-    src = df.groupby(["date", "quarter", "mrn"]).size().reset_index().groupby("quarter").count().reset_index()
-    src = src[["quarter", "mrn"]]
-    src.columns = ["Quarter", "Encounters"]
+@perf.timed
+def st_enc_by_quarter_fig(charts, ct):
+    src = charts["enc_by_quarter"]
     fig = px.bar(src, title="Encounters by Quarter", x="Quarter", y="Encounters", text="Encounters", text_auto="i")
     ct.plotly_chart(fig, use_container_width=True)
 
-def st_enc_by_day_fig(partitions, start_date, end_date, ct):
-    # Filter out encounters outside of time period (see comment in st_enc_by_month_fig())
-    df = partitions["all_encs"]
-    df = df[df["date"].dt.date >= start_date]
-    df = df[df["date"].dt.date < (end_date + pd.Timedelta(days=1))]
-
-    src = df.groupby(["date", "mrn"]).size().reset_index().groupby("date").count().reset_index()
-    src = src[["date", "mrn"]]
-    src.columns = ["Date", "Encounters"]
+@perf.timed
+def st_enc_by_day_fig(charts, ct):
+    src = charts["enc_by_day"]
     fig = px.bar(src, title="Encounters by Day", x="Date", y="Encounters", text="Encounters", text_auto="i")
     fig.update_xaxes(tickformat="%a %m-%d-%y") # Make x-axis dates include weekday and show only date, even when zoomed in (ie. no time)
     fig.update_layout(hovermode="x")
     ct.plotly_chart(fig, use_container_width=True)    
 
-def st_rvu_by_month_fig(df, end_date, ct):
+@perf.timed
+def st_rvu_by_month_fig(charts, ct):
     """
     Bar graph of wRVUs. Note that for month/quarter, we are using the charge posted date like the
     clinic does, so number match and the user knows what to expect at when comparing to the production report.
     However, for wRVU/day, we showing it with the actual visit date, which is more helpful for understanding
     actual production.
     """
-    # Data was filtered on visit date OR posted date. Since charges may be posted after our specified time period,
-    # remove the ones out of our period to avoid confusion for the user.
-    df = df[df["posted_date"].dt.date < (end_date + pd.Timedelta(days=1))]
-
-    # Group and add wrvus by month
-    src = df.groupby("posted_month").wrvu.sum().reset_index()
-    src.columns = ["Month", "wRVUs"]
+    src = charts["rvu_by_month"]
     fig = px.bar(src, title="wRVUs", x="Month", y="wRVUs", text="wRVUs", text_auto=".1f", hover_data={"wRVUs": ":.1f"}).update_traces(marker_color="#00ac75")
     fig.update_layout(title_x=0.5)
     fig.update_xaxes(tickformat="%b %Y")
     ct.plotly_chart(fig, use_container_width=True)    
 
-def st_rvu_by_quarter_fig(df, end_date, ct):
-    # Filter out posted charges outside of the filtered time period (see comment in st_rvu_by_month_fig())
-    df = df[df["posted_date"].dt.date < (end_date + pd.Timedelta(days=1))]
-
-    # Group and add wrvus by quarter
-    src = df.groupby("posted_quarter").wrvu.sum().reset_index()
-    src.columns = ["Quarter", "wRVUs"]
+@perf.timed
+def st_rvu_by_quarter_fig(charts, ct):
+    src = charts["rvu_by_quarter"]
     fig = px.bar(src, title="wRVUs by Quarter", x="Quarter", y="wRVUs", text="wRVUs", text_auto=".1f", hover_data={"wRVUs": ":.1f"}).update_traces(marker_color="#00ac75")
     ct.plotly_chart(fig, use_container_width=True)    
 
-def st_rvu_by_day_fig(df, start_date, end_date, ct):
-    # Filter out posted charges outside of the filtered time period
-    #
-    # The filtering is different than quarterly and monthly graphs because
-    # we group by visit date here. The other graphs are grouped by posting date.
+@perf.timed
+def st_rvu_by_day_fig(charts, ct):
+    # Grouped by visit date, unlike the quarterly and monthly graphs, which are grouped by posting date.
     #
     # This is because the monthly/quarterly RVU graphs will better match with
     # the administrative data reports which are based on posting date.
     # However, when looking at the per-day graph, it is more natural to 
     # be to correlate number of visits on each day next to the RVUs 
     # produced on that date. So only the by day graph is grouped by visit date.
-    df = df[df["date"].dt.date >= start_date]
-    df = df[df["date"].dt.date < (end_date + pd.Timedelta(days=1))]
-
-    src = df.groupby("date").wrvu.sum().reset_index()
-    src.columns = ["Date", "wRVUs"]
+    src = charts["rvu_by_day"]
     fig = px.bar(src, title="wRVUs by Day", x="Date", y="wRVUs", text="wRVUs", text_auto=".1f", hover_data={"wRVUs": ":.1f"}).update_traces(marker_color="#00ac75")
     fig.update_xaxes(tickformat="%a %m-%d-%y") # Make x-axis dates include weekday and show only date, even when zoomed in (ie. no time)
     fig.update_layout(hovermode="x")
     ct.plotly_chart(fig, use_container_width=True)    
 
+@perf.timed
+def st_group_enc_by_month_fig(charts, ct):
+    """Encounters by month for each provider, from data.process_all()"""
+    src = charts["enc_by_month"]
+    fig = px.bar(src, title="Encounters", x="Month", y="Encounters", color="Provider", barmode="group")
+    fig.update_layout(title_x=0.5)
+    fig.update_xaxes(tickformat="%b %Y")
+    ct.plotly_chart(fig, use_container_width=True)
+
+@perf.timed
+def st_group_rvu_by_month_fig(charts, ct):
+    """wRVUs by posted month for each provider, from data.process_all(). See st_rvu_by_month_fig()."""
+    src = charts["rvu_by_month"]
+    fig = px.bar(src, title="wRVUs", x="Month", y="wRVUs", color="Provider", barmode="group", hover_data={"wRVUs": ":.1f"})
+    fig.update_layout(title_x=0.5)
+    fig.update_xaxes(tickformat="%b %Y")
+    ct.plotly_chart(fig, use_container_width=True)
+
+@perf.timed
+def st_group_rvu_per_enc_fig(stats, ct):
+    """wRVU per encounter for each provider"""
+    src = stats.wrvu_per_encs.rename_axis("Provider").reset_index(name="wRVU / encounter")
+    fig = px.bar(src, title="wRVU / encounter", x="Provider", y="wRVU / encounter", text="wRVU / encounter", text_auto=".2f").update_traces(marker_color="#00ac75")
+    fig.update_layout(title_x=0.5)
+    ct.plotly_chart(fig, use_container_width=True)
+
+@perf.timed
 def st_sick_visits_fig(stats, ct):
     """Breakdown of sick visit types (99213 vs 99214, etc) pie chart"""
     src = pd.DataFrame({
@@ -147,6 +164,7 @@ def st_sick_visits_fig(stats, ct):
     fig.update_traces(sort=False) 
     ct.plotly_chart(fig, use_container_width=True)
 
+@perf.timed
 def st_sick_vs_well_fig(stats, ct):
     """Sick vs well pie chart"""
     src = pd.DataFrame({
@@ -159,6 +177,7 @@ def st_sick_vs_well_fig(stats, ct):
     fig.update_traces(sort=False) 
     ct.plotly_chart(fig, use_container_width=True)
 
+@perf.timed
 def st_wcc_visits_fig(stats, ct):
     """Breakdown of well visit types by age"""
     src = pd.DataFrame({
@@ -177,6 +196,7 @@ def st_wcc_visits_fig(stats, ct):
     fig.update_traces(sort=False) 
     ct.plotly_chart(fig, use_container_width=True)
 
+@perf.timed
 def st_non_encs_fig(partitions, ct):
     """Bar chart of non-encounter charges (e.g. shots, fluoride, etc), sorted by most total wRVUs"""
     src = partitions["outpt_non_enc_wrvus"]
@@ -192,16 +212,16 @@ def st_non_encs_fig(partitions, ct):
     fig.update_layout(hovermode="x")
     ct.plotly_chart(fig, use_container_width=True)
 
-def st_inpt_encs_fig(partitions, ct):
-    groupby = partitions["inpt_all"].groupby("date") 
-    ndays = groupby.ngroups 
-    src = groupby.mrn.nunique().reset_index()
-    src.columns = ["Date", "Encounters"]
+@perf.timed
+def st_inpt_encs_fig(charts, ct):
+    src = charts["inpt_enc_by_day"]
+    ndays = len(src)
     fig = px.bar(src, title=f"Encounters by Day ({ndays} active days)", x="Date", y="Encounters", text="Encounters", text_auto="i")
     fig.update_xaxes(tickformat="%a %m-%d-%y") # Make x-axis dates include weekday and show only date, even when zoomed in (ie. no time)
     fig.update_layout(hovermode="x")
     ct.plotly_chart(fig, use_container_width=True)    
 
+@perf.timed
 def st_inpt_vs_outpt_encs_fig(stats, ct):
     src = pd.DataFrame({
         "Type": ["Outpatient ({n} pts)".format(n=stats["outpt_num_pts"]), 
@@ -213,6 +233,7 @@ def st_inpt_vs_outpt_encs_fig(stats, ct):
     fig.update_traces(sort=False) 
     ct.plotly_chart(fig, use_container_width=True)
 
+@perf.timed
 def st_inpt_vs_outpt_rvu_fig(stats, ct):
     src = pd.DataFrame({
     "Type": ["Outpatient ({n} wRVU)".format(n=round(stats["outpt_ttl_wrvu"], 1)), 
@@ -0,0 +1,60 @@
+import typing
+import threading
+from collections import OrderedDict
+
+
+class LruCache:
+    """
+    Least recently used cache bounded by the total size of its entries. Thread safe, so a single
+    instance at module level is shared by all sessions in the server process.
+    """
+
+    def __init__(self, max_bytes: int, sizeof: typing.Callable[[typing.Any], int]):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: typing.Hashable) -> typing.Any:
+        """Return cached value and mark it most recently used, or None if not cached"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: typing.Hashable, value: typing.Any) -> None:
+        """Cache value, evicting least recently used entries to stay within max_bytes"""
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def info(self) -> dict[str, int]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,121 @@
+import os
+import re
+import uuid
+import typing
+import hashlib
+import concurrent.futures
+import logging
+import pandas as pd
+from . import data_files, data_parser
+
+# Location of cached, parsed data files: rvu-dash/cache/parsed/
+PARSED_PATH = os.path.join(data_files.CACHE_PATH, "parsed")
+
+
+def _cache_path(fname: str, digest: str) -> str:
+    """
+    Path to the cached Parquet file for a source file name and content hash. The name includes a hash of
+    the full path, so files with the same name in different directories have separate entries.
+    """
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", os.path.basename(fname))
+    name += "-" + hashlib.sha256(fname.encode()).hexdigest()[:8]
+    return os.path.join(
+        PARSED_PATH, f"{name}-{digest[:16]}-v{data_parser.PARSER_VERSION}.parquet"
+    )
+
+
+def _remove_stale(path: str) -> None:
+    """Delete cache entries for older versions of the same file, except files other writers are still saving"""
+    prefix = os.path.basename(path).rsplit("-", 2)[0] + "-"
+    for entry in os.listdir(PARSED_PATH):
+        if (
+            entry.startswith(prefix)
+            and entry != os.path.basename(path)
+            and not entry.endswith(".tmp")
+        ):
+            os.remove(os.path.join(PARSED_PATH, entry))
+
+
+def _file_digest(path: str) -> str:
+    """Hash a local file in blocks without reading it all into memory"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _get(
+    fname: str,
+    digest: str,
+    pool: typing.Optional[concurrent.futures.Executor],
+    save: bool,
+    parse: typing.Callable,
+    *args,
+) -> pd.DataFrame:
+    """
+    Return cached DataFrame for file name and content hash, or call parse(*args) and cache the result
+    if save is set. If a pool is given, the parser runs in it.
+    """
+    path = _cache_path(fname, digest)
+    if os.path.isfile(path):
+        try:
+            return pd.read_parquet(path)
+        except Exception:
+            logging.warning("Could not read cached " + path + ", parsing " + fname)
+
+    df = pool.submit(parse, *args).result() if pool else parse(*args)
+    if df is not None and save:
+        _put(fname, digest, df)
+    return df
+
+
+def _put(fname: str, digest: str, df: pd.DataFrame) -> None:
+    """Cache parsed data for a file name and content hash, replacing entries for older versions of the file"""
+    path = _cache_path(fname, digest)
+    # Write to a temp file and move into place so readers never see a partial file. Temp files are unique
+    # to this writer, since other server processes may be caching the same file.
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.makedirs(PARSED_PATH, exist_ok=True)
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+        _remove_stale(path)
+    except Exception:
+        logging.warning("Could not cache parsed data for " + fname, exc_info=True)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def get_df_from_path(
+    path: str,
+    pool: concurrent.futures.Executor = None,
+    fname: str = None,
+    save: bool = True,
+) -> pd.DataFrame:
+    """
+    Same as data_parser.get_df_from_path(), but reuses a previously parsed copy of the file if one is
+    cached on disk. Entries are keyed by file name, content hash and parser version, so changed files
+    or parser updates are always parsed again. Files are never read into memory all at once.
+
+    The cache entry is named after fname if given, e.g. for an upload saved to a temp file before it is
+    moved to fname. If save is not set, a parsed file is not cached, e.g. until an upload is checked
+    (see put()).
+    """
+    logging.info("Reading " + path)
+    return _get(
+        fname or path,
+        _file_digest(path),
+        pool,
+        save,
+        data_parser.get_df_from_path,
+        path,
+    )
+
+
+def put(path: str, df: pd.DataFrame, fname: str = None) -> None:
+    """Cache df parsed from a local file, named after fname if given (see get_df_from_path())"""
+    digest = _file_digest(path)
+    if not os.path.isfile(_cache_path(fname or path, digest)):
+        _put(fname or path, digest, df)
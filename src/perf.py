@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import typing
+import logging
+import functools
+import threading
+import contextlib
+import collections
+from dataclasses import dataclass, field
+
+# Spans kept per thread. Streamlit runs each session's script in its own thread, and spans are cleared
+# at the start of each run, so this only limits threads that never start a run (e.g. background work).
+MAX_SPANS = 1000
+
+# Spans are logged as JSON lines through the rvu.perf logger, and shown according to the app's logging
+# config. The root logger only shows warnings under `streamlit run`, so set STREAMLIT_PERF_LOG=1 to write
+# spans to stderr. They then don't propagate, so spans aren't logged twice where root logs INFO.
+PERF_LOG = os.environ.get("STREAMLIT_PERF_LOG") == "1"
+
+logger = logging.getLogger("rvu.perf")
+if PERF_LOG and not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+@dataclass
+class Span:
+    """Timing for a named stage of work"""
+
+    name: str
+    # Nesting level, 0 for spans not started inside another span
+    depth: int
+    # Wall time
+    seconds: float = None
+    # Number of rows processed, if applicable
+    rows: int = None
+    # Change in resident memory of the process, if available
+    rss_mb: float = None
+    # Other values to log, e.g. whether a result came from cache
+    fields: dict[str, typing.Any] = field(default_factory=dict)
+
+
+_local = threading.local()
+
+
+def _state():
+    if not hasattr(_local, "spans"):
+        _local.spans = collections.deque(maxlen=MAX_SPANS)
+        _local.depth = 0
+    return _local
+
+
+def _rss() -> typing.Optional[int]:
+    """Resident memory of this process in bytes, or None if not available (only Linux is supported)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def start_run() -> None:
+    """Clear spans recorded in this thread. Called at the start of each script run."""
+    state = _state()
+    state.spans.clear()
+    state.depth = 0
+
+
+def spans() -> list[Span]:
+    """Spans recorded in this thread since start_run(), in the order they were started"""
+    return list(_state().spans)
+
+
+@contextlib.contextmanager
+def span(name: str, rows: int = None, **fields) -> typing.Iterator[Span]:
+    """
+    Time the enclosed block and log the result as a JSON line. The yielded Span can be updated inside
+    the block, e.g. to set rows once they are known or add fields.
+    """
+    state = _state()
+    record = Span(name=name, depth=state.depth, rows=rows, fields=fields)
+    state.spans.append(record)
+    state.depth += 1
+    rss = _rss()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record.seconds = time.perf_counter() - start
+        end_rss = _rss()
+        if rss is not None and end_rss is not None:
+            record.rss_mb = (end_rss - rss) / 2**20
+        state.depth -= 1
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                json.dumps(
+                    {
+                        "span": name,
+                        "seconds": round(record.seconds, 6),
+                        "rows": record.rows,
+                        "rss_mb": (
+                            None if record.rss_mb is None else round(record.rss_mb, 2)
+                        ),
+                        **record.fields,
+                    },
+                    default=str,
+                )
+            )
+
+
+def timed(fn: typing.Callable) -> typing.Callable:
+    """Decorator to record each call to fn as a span named after the function"""
+    name = f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with span(name):
+            return fn(*args, **kwargs)
+
+    return wrapper
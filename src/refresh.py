@@ -0,0 +1,114 @@
+import os
+import time
+import typing
+import logging
+import threading
+from . import data, data_files, fetch, perf
+
+# Seconds between checks of local data files for changes
+REFRESH_SECONDS = float(os.environ.get("STREAMLIT_REFRESH_SECONDS", 5))
+# Seconds between conditional requests to check data file URLs for changes
+URL_REFRESH_SECONDS = float(os.environ.get("STREAMLIT_URL_REFRESH_SECONDS", 15 * 60))
+# Seconds a request waits for the first data set in this process before giving up
+INIT_TIMEOUT_SECONDS = float(os.environ.get("STREAMLIT_INIT_TIMEOUT_SECONDS", 10 * 60))
+
+# Latest data set, replaced as a whole by the refresh thread. Each script run reads it once with get(),
+# so a run keeps using the same data set even if a new one is swapped in while it runs.
+_current: data.RvuData = None
+# Error from building the first data set, until one is built
+_error: Exception = None
+# Set once the first data set has been built, or failed to build
+_ready = threading.Event()
+# Set to check for changes right away instead of waiting for the next interval
+_wake = threading.Event()
+_lock = threading.Lock()
+_thread: threading.Thread = None
+
+
+def _stamps(filename_or_urls: list[str]) -> dict[str, tuple]:
+    """Size and modification time of each file, or of the local copy of each URL"""
+    stamps = {}
+    for f in filename_or_urls:
+        try:
+            stat = os.stat(fetch.local_path(f) if data.is_url(f) else f)
+            stamps[f] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            stamps[f] = None
+    return stamps
+
+
+def _run() -> None:
+    """Rebuild the data set whenever the list of data files or their contents change"""
+    global _current, _error
+    # Files as of the current data set, and as of the last failed build, which isn't retried until
+    # files change again
+    last_stamps, failed_stamps, last_fetch = None, None, None
+    while True:
+        _wake.clear()
+        try:
+            perf.start_run()
+            files = data_files.get()
+
+            # Revalidate URLs against their local copies, which are only downloaded again if changed
+            urls = [f for f in files if data.is_url(f)]
+            if urls and (
+                last_fetch is None
+                or time.monotonic() - last_fetch >= URL_REFRESH_SECONDS
+            ):
+                last_fetch = time.monotonic()
+                for url in urls:
+                    fetch.get(url)
+
+            stamps = _stamps(files)
+            if stamps != last_stamps and stamps != failed_stamps:
+                failed_stamps = stamps
+                changed = [
+                    f
+                    for f in files
+                    if last_stamps and f in last_stamps and stamps[f] != last_stamps[f]
+                ]
+                logging.info(
+                    f"Data files changed, refreshing data set ({len(files)} files, {len(changed)} changed)"
+                )
+                with perf.span("refresh", files=len(files)) as span:
+                    rvudata = data.initialize(files, changed)
+                    span.rows = len(rvudata.df.index) if rvudata is not None else 0
+                # Swap in the new data set. Readers get either the old or new one, never a mix.
+                _current, _error = rvudata, None
+                last_stamps, failed_stamps = stamps, None
+        except Exception as e:
+            logging.exception("Could not refresh data set")
+            # Requests keep using the current data set if there is one, otherwise they show the error
+            if _current is None:
+                _error = e
+        _ready.set()
+        _wake.wait(REFRESH_SECONDS)
+
+
+def start() -> None:
+    """Start the refresh thread for this process, if it isn't running"""
+    global _thread
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_run, name="rvu-refresh", daemon=True)
+            _thread.start()
+
+
+def trigger() -> None:
+    """Check data files for changes now, e.g. after files are uploaded"""
+    _wake.set()
+
+
+def get(timeout: float = INIT_TIMEOUT_SECONDS) -> typing.Optional[data.RvuData]:
+    """
+    Latest data set. Starts the refresh thread if needed. Only waits if the first data set in this
+    process is still being built, which usually just opens the store saved by another process.
+    Raises an error if the first data set could not be built, or was not ready within timeout seconds.
+    """
+    start()
+    if not _ready.wait(timeout):
+        raise TimeoutError(f"Data set was not ready after {timeout:g} seconds")
+    error = _error
+    if error is not None:
+        raise RuntimeError(f"Could not build data set: {error}") from error
+    return _current
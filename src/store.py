@@ -0,0 +1,176 @@
+import os
+import json
+import uuid
+import pickle
+import typing
+import hashlib
+import logging
+import pandas as pd
+import pyarrow as pa
+from . import data_files
+
+# Location of prepared data sets shared by all server processes: rvu-dash/cache/store/
+STORE_PATH = os.path.join(data_files.CACHE_PATH, "store")
+
+# Increase when the stored layout or the metadata saved with it (data.RvuData) changes, so stores
+# written by older code are not loaded
+STORE_VERSION = 3
+
+
+def key(filename_or_urls: list[str]) -> str:
+    """
+    Identify a data set by its source files. Local files also include their size and modification time,
+    so replacing a file with one of the same name gives a new key.
+    """
+    sources = []
+    for f in filename_or_urls:
+        try:
+            stat = os.stat(f)
+            sources.append([f, stat.st_size, stat.st_mtime_ns])
+        except OSError:
+            sources.append([f])
+    digest = hashlib.sha256(json.dumps([STORE_VERSION, sources]).encode()).hexdigest()
+    return digest[:16]
+
+
+def _path(name: str, ext: str) -> str:
+    return os.path.join(STORE_PATH, f"{name}.{ext}")
+
+
+def _write(path: str, write: typing.Callable[[str], None]) -> None:
+    """
+    Call write(tmp) and move the file into place. Files are never overwritten in place, because other
+    processes may have them memory mapped.
+    """
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _remove_stale(keep: list[str]) -> None:
+    """Delete all other entries. Only the latest data set is kept."""
+    for entry in os.listdir(STORE_PATH):
+        if entry not in keep:
+            try:
+                os.remove(os.path.join(STORE_PATH, entry))
+            except OSError:
+                pass
+
+
+def save(store_key: str, df: pd.DataFrame, meta: typing.Any) -> None:
+    """
+    Store df as an uncompressed Arrow IPC (Feather v2) file with one record batch, so it can be memory
+    mapped by load(), and pickle meta next to it. Large arrays in meta, like numpy arrays, are written to
+    a separate file that is memory mapped as well. A pointer file for the key is written last, so readers
+    only ever see a complete data set. The index of df is not stored.
+    """
+    os.makedirs(STORE_PATH, exist_ok=True)
+    name = uuid.uuid4().hex
+    table = pa.Table.from_pandas(df, preserve_index=False).combine_chunks()
+    buffers = []
+    pickled = pickle.dumps(meta, protocol=5, buffer_callback=buffers.append)
+    offsets = []
+
+    def write_table(path: str) -> None:
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(
+            sink, table.schema
+        ) as writer:
+            writer.write_table(table, max_chunksize=max(table.num_rows, 1))
+
+    def write_meta(path: str) -> None:
+        with open(path, "wb") as f:
+            f.write(pickled)
+
+    def write_buffers(path: str) -> None:
+        # Align each buffer to 64 bytes, like Arrow does
+        with open(path, "wb") as f:
+            for buffer in buffers:
+                f.write(b"\0" * (-f.tell() % 64))
+                raw = buffer.raw()
+                offsets.append([f.tell(), raw.nbytes])
+                f.write(raw)
+
+    def write_pointer(path: str) -> None:
+        with open(path, "w") as f:
+            json.dump({"name": name, "buffers": offsets}, f)
+
+    _write(_path(name, "arrow"), write_table)
+    _write(_path(name, "pkl"), write_meta)
+    _write(_path(name, "buf"), write_buffers)
+    _write(_path(store_key, "json"), write_pointer)
+    _remove_stale([f"{store_key}.json", f"{name}.arrow", f"{name}.pkl", f"{name}.buf"])
+    logging.info(
+        f"Stored data set {store_key} ({table.num_rows} rows, {table.nbytes / 2**20:.1f} MB)"
+    )
+
+
+def _can_view(column: pa.ChunkedArray) -> bool:
+    """True if numpy can use the column's buffer as is: a single chunk of numbers or timestamps without nulls"""
+    t = column.type
+    return (
+        column.num_chunks == 1
+        and column.null_count == 0
+        and (
+            pa.types.is_integer(t)
+            or pa.types.is_floating(t)
+            or pa.types.is_timestamp(t)
+        )
+    )
+
+
+def _to_pandas(table: pa.Table) -> pd.DataFrame:
+    """
+    Convert a memory mapped table to a DataFrame without copying most of the data. Numbers and timestamps
+    without missing values become read only numpy views, and strings stay Arrow backed. Categorical codes
+    and bools are copied, which are small.
+    """
+    views = [
+        name
+        for name, column in zip(table.column_names, table.columns)
+        if _can_view(column)
+    ]
+    converted = table.drop_columns(views).to_pandas(split_blocks=True)
+    columns = {
+        name: (
+            table.column(name).chunk(0).to_numpy(zero_copy_only=True)
+            if name in views
+            else converted[name]
+        )
+        for name in table.column_names
+    }
+    return pd.DataFrame(columns, index=pd.RangeIndex(table.num_rows), copy=False)
+
+
+def exists(store_key: str) -> bool:
+    """True if a data set was saved for the key"""
+    return os.path.isfile(_path(store_key, "json"))
+
+
+def load(store_key: str) -> typing.Optional[tuple[pd.DataFrame, typing.Any]]:
+    """
+    Open a data set written by save(), in this or another process. Returns the DataFrame, backed by the
+    memory mapped file, and the metadata, or None if there is no stored data set for the key.
+    """
+    try:
+        with open(_path(store_key, "json")) as f:
+            pointer = json.load(f)
+        name = pointer["name"]
+        buffers = pa.memory_map(_path(name, "buf")).read_buffer()
+        with open(_path(name, "pkl"), "rb") as f:
+            meta = pickle.loads(
+                f.read(),
+                buffers=[
+                    buffers.slice(offset, size) for offset, size in pointer["buffers"]
+                ],
+            )
+        table = pa.ipc.open_file(pa.memory_map(_path(name, "arrow"))).read_all()
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logging.warning(f"Could not read stored data set {store_key}", exc_info=True)
+        return None
+    return _to_pandas(table), meta
@@ -1,13 +1,13 @@
+import typing
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import datetime as dt
 import arrow
 from datetime import date
-from . import auth, data, fig, dates
+from . import auth, data, export, fig, dates, perf
 
 
-def render_upload(cur_files: list = None):
+def render_upload(cur_files: list = None, rvudata: data.RvuData = None):
     """Provide a way to upload updated data file"""
     st.header("Updated data files")
     st.markdown(
@@ -16,11 +16,40 @@ def render_upload(cur_files: list = None):
     if cur_files:
         st.write("Current data files:")
         st.write(cur_files)
+    if rvudata is not None:
+        # Rows read from each file in the current data set, and charges not counted because another file has them
+        st.write("Current data set:")
+        st.dataframe(
+            pd.DataFrame(
+                [[f, s.rows, s.duplicates] for f, s in rvudata.sources.items()],
+                columns=["File", "Charges", "Duplicates dropped"],
+            ),
+            hide_index=True,
+        )
     remove_existing = st.checkbox("Remove existing files after upload")
     files = st.file_uploader("Select files to upload", accept_multiple_files=True)
     return files, remove_existing
 
 
+def render_upload_checks(checks: list[data.UploadCheck]):
+    """Show what was found in each uploaded file, and why any files were rejected"""
+    for check in checks:
+        if check.error:
+            st.error(f"**{check.name}** was not added: {check.error}")
+            continue
+        posted = (
+            f"posted {check.start_date.strftime('%m/%d/%Y')} to {check.end_date.strftime('%m/%d/%Y')}"
+            if check.start_date
+            else "no valid posted dates"
+        )
+        st.info(f"**{check.name}**: {check.rows:,} charges, {posted}")
+        if check.unknown_providers:
+            st.warning(
+                f"**{check.name}** has charges for providers not in the provider list, which are not shown: "
+                + ", ".join(check.unknown_providers)
+            )
+
+
 def render_sidebar(
     data_start_date: date, data_end_date: date
 ) -> tuple[str, date, date, date, date]:
@@ -34,7 +63,7 @@ def render_sidebar(
     # Filter options for providers
     provider = config_ct.selectbox(
         "Provider:",
-        ["Select a Provider", "Gordon", "Katie", "Kenzie", "Lee", "Mike", "Shields"],
+        ["Select a Provider", data.ALL_PROVIDERS] + data.KNOWN_PROVIDER,
     )
 
     # Preset date filters
@@ -115,7 +144,7 @@ def render_sidebar(
         visitlog = visitlog_ct.file_uploader("Upload a log file to validate")
 
     # Table of contents
-    if (provider != "Select a Provider") and (visitlog is None):
+    if provider not in ("Select a Provider", data.ALL_PROVIDERS) and (visitlog is None):
         config_ct.header("Sections")
         config_ct.markdown(
             "* [Summary](#summary)\n* [Outpatient](#outpatient)\n* [Inpatient](#inpatient)\n* [Source Data](#source-data)",
@@ -139,7 +168,7 @@ def render_validate_visit(visit_data: data.VisitLogData):
     # First print visits where there was a difference between the visits log and posted charges
     if visit_data.diff is not None and len(visit_data.diff) > 0:
         diff = visit_data.diff.copy()
-        diff.columns = ["Date", "MRN", "E&M Code in Log"]
+        diff.columns = ["Date", "MRN", "E&M Code in Log", "Billed Codes"]
         styled = diff.style.format({"Date": lambda x: x.strftime("%m/%d/%Y")})
         st.write("Differences between visits log and posted charges:")
         st.write(styled)
@@ -180,21 +209,117 @@ def render_dataset(data: data.FilteredRvuData, dataset_ct: st.container):
 
     # Filters for other partitions not used elsewhere
     if dataset_name == "Clinic - 99211 and 99212":
-        display_df = df[df.cpt.str.match("992[01][12]")]
+        display_df = df[df.em_level.isin([1, 2])]
     elif dataset_name == "Clinic - 99213":
-        display_df = df[df.cpt.str.match("992[01]3")]
+        display_df = df[df.em_level == 3]
     elif dataset_name == "Clinic - 99214 and above":
-        display_df = df[df.cpt.str.match("992[01][45]|9949[56]")]
+        display_df = df[df.em_level.isin([4, 5]) | df.tcm]
 
     if not display_df is None:
-        with st.spinner():
-            st.download_button(
-                "Download CSV",
-                display_df.to_csv(),
-                file_name=(dataset_name + ".csv"),
-                mime="text/csv",
-            )
-            fig.st_aggrid(display_df)
+        del display_dfs["None"]
+        render_download(data, dataset_name, display_df, display_dfs)
+        render_grid(
+            display_df,
+            (
+                data.all.version,
+                data.provider,
+                data.start_date,
+                data.end_date,
+                dataset_name,
+            ),
+        )
+
+
+def render_download(
+    data: data.FilteredRvuData,
+    dataset_name: str,
+    display_df: pd.DataFrame,
+    all_dfs: dict[str, pd.DataFrame],
+) -> None:
+    """
+    Download button for the shown data set as CSV or Parquet, or for all data sets as an Excel
+    workbook with one sheet each. Files are only generated when the button is clicked.
+    """
+    fmt_ct, button_ct = st.columns([1, 3], vertical_alignment="bottom")
+    fmt = fmt_ct.selectbox(
+        "Download as", list(export.FORMATS.keys()), key="download_fmt"
+    )
+    ext, mime = export.FORMATS[fmt]
+    key = (data.provider, data.start_date, data.end_date)
+    if fmt == "Excel":
+        label, name = (
+            "Download all data sets",
+            f"{data.provider} {data.start_date} to {data.end_date}",
+        )
+        write = lambda path: export.write_xlsx(all_dfs, path)
+    else:
+        label, name = "Download " + fmt, dataset_name
+        key += (dataset_name,)
+        write = lambda path: (
+            export.write_csv if fmt == "CSV" else export.write_parquet
+        )(display_df, path)
+
+    button_ct.download_button(
+        label,
+        lambda: export.get(data.all.version, key, fmt, write),
+        file_name=f"{name}.{ext}",
+        mime=mime,
+        on_click="ignore",
+    )
+
+
+@st.fragment
+def render_grid(df: pd.DataFrame, key: tuple) -> None:
+    """
+    Show df one page at a time. Search, sort, and row counts are computed on the server and only
+    the visible page is sent to the browser. Matching rows are kept in session state by key (which
+    identifies df) and search options, so changing pages only reruns this fragment.
+    """
+    search_ct, sort_ct, order_ct = st.columns([2, 1, 1])
+    search = search_ct.text_input("Search", key="grid_search").strip()
+    sort_by = sort_ct.selectbox("Sort by", [None] + list(df.columns), key="grid_sort")
+    descending = (
+        order_ct.selectbox("Order", ["Ascending", "Descending"], key="grid_order")
+        == "Descending"
+    )
+
+    rows_key = key + (search, sort_by, descending)
+    cached = st.session_state.get("grid_rows")
+    if cached is None or cached[0] != rows_key:
+        cached = (rows_key, data.find_rows(df, search, sort_by, descending))
+        st.session_state["grid_rows"] = cached
+        st.session_state["grid_page"] = 1
+    rows = cached[1]
+
+    page_ct, size_ct, _ = st.columns([1, 1, 2])
+    page_size = size_ct.selectbox("Rows per page", [30, 100, 500], key="grid_page_size")
+    npages = max(1, -(-len(rows) // page_size))
+    if st.session_state.get("grid_page", 1) > npages:
+        st.session_state["grid_page"] = 1
+    page = page_ct.number_input(
+        f"Page (of {npages})", min_value=1, max_value=npages, key="grid_page"
+    )
+
+    first = (page - 1) * page_size
+    page_rows = rows[first : first + page_size]
+    caption = f"Rows {first + 1 if len(page_rows) else 0}-{first + len(page_rows)} of {len(rows)}"
+    if len(rows) < len(df.index):
+        caption += f" (filtered from {len(df.index)})"
+    fig.st_aggrid(df.iloc[page_rows], caption=caption, paginate=False)
+
+
+def render_on_demand(label: str, key: str, render: typing.Callable[[], None]) -> None:
+    """
+    Show a toggle and call render() to draw a section only while it is on. The section is a
+    fragment, so toggling it or interacting with its graphs reruns only the section, not the page.
+    """
+
+    @st.fragment
+    def section():
+        if st.toggle(label, key=key):
+            render()
+
+    section()
 
 
 def render_main(
@@ -247,65 +372,47 @@ def render_main(
             '<p style="margin-top:0px; margin-bottom:-15px; text-align:center; color:#A9A9A9">RVU graphs do not include charges posted outside of dates, so totals may not match number above.</p>',
             unsafe_allow_html=True,
         )
+        zoom_caption = '<p style="margin-top:-15px; margin-bottom:10px; text-align:center; color:#A9A9A9">To zoom in, click on a graph and drag horizontally</p>'
         if compare is None:
             enc_ct, rvu_ct = st.columns(2)
-            quarter_ct = st.expander("By Quarter")
-            quarter_enc_ct, quarter_rvu_ct = quarter_ct.columns(2)
-            daily_ct = st.expander("By Day")
-            daily_enc_ct, daily_rvu_ct = daily_ct.columns(2)
-            fig.st_enc_by_month_fig(partitions, data.start_date, data.end_date, enc_ct)
-            fig.st_rvu_by_month_fig(df, data.end_date, rvu_ct)
-            fig.st_enc_by_quarter_fig(
-                partitions, data.start_date, data.end_date, quarter_enc_ct
-            )
-            fig.st_rvu_by_quarter_fig(df, data.end_date, quarter_rvu_ct)
-            fig.st_enc_by_day_fig(
-                partitions, data.start_date, data.end_date, daily_enc_ct
-            )
-            fig.st_rvu_by_day_fig(df, data.start_date, data.end_date, daily_rvu_ct)
-            daily_ct.markdown(
-                '<p style="margin-top:-15px; margin-bottom:10px; text-align:center; color:#A9A9A9">To zoom in, click on a graph and drag horizontally</p>',
-                unsafe_allow_html=True,
-            )
-        else:
-            main_ct = st.container()
-            main_colL, main_colR = main_ct.columns(2)
-            quarter_ct = st.expander("By Quarter")
-            quarter_colL, quarter_colR = quarter_ct.columns(2)
-            daily_ct = st.expander("By Day")
-            daily_colL, daily_colR = daily_ct.columns(2)
-            fig.st_enc_by_month_fig(
-                partitions, data.start_date, data.end_date, main_colL
-            )
-            fig.st_rvu_by_month_fig(df, data.end_date, main_colL)
-            fig.st_enc_by_quarter_fig(
-                partitions, data.start_date, data.end_date, quarter_colL
-            )
-            fig.st_rvu_by_quarter_fig(df, data.end_date, quarter_colL)
-            fig.st_enc_by_day_fig(
-                partitions, data.start_date, data.end_date, daily_colL
-            )
-            fig.st_rvu_by_day_fig(df, data.start_date, data.end_date, daily_colL)
+            fig.st_enc_by_month_fig(data.charts, enc_ct)
+            fig.st_rvu_by_month_fig(data.charts, rvu_ct)
 
-            fig.st_enc_by_month_fig(
-                cmp_partitions, compare.start_date, compare.end_date, main_colR
-            )
-            fig.st_rvu_by_month_fig(cmp_df, compare.end_date, main_colR)
-            fig.st_enc_by_quarter_fig(
-                cmp_partitions, compare.start_date, compare.end_date, quarter_colR
-            )
-            fig.st_rvu_by_quarter_fig(cmp_df, compare.end_date, quarter_colR)
-            fig.st_enc_by_day_fig(
-                cmp_partitions, compare.start_date, compare.end_date, daily_colR
-            )
-            fig.st_rvu_by_day_fig(
-                cmp_df, compare.start_date, compare.end_date, daily_colR
-            )
+            def render_by_quarter():
+                enc_ct, rvu_ct = st.columns(2)
+                fig.st_enc_by_quarter_fig(data.charts, enc_ct)
+                fig.st_rvu_by_quarter_fig(data.charts, rvu_ct)
 
-            daily_ct.markdown(
-                '<p style="margin-top:-15px; margin-bottom:10px; text-align:center; color:#A9A9A9">To zoom in, click on a graph and drag horizontally</p>',
-                unsafe_allow_html=True,
-            )
+            def render_by_day():
+                enc_ct, rvu_ct = st.columns(2)
+                fig.st_enc_by_day_fig(data.charts, enc_ct)
+                fig.st_rvu_by_day_fig(data.charts, rvu_ct)
+                st.markdown(zoom_caption, unsafe_allow_html=True)
+
+        else:
+            main_colL, main_colR = st.columns(2)
+            fig.st_enc_by_month_fig(data.charts, main_colL)
+            fig.st_rvu_by_month_fig(data.charts, main_colL)
+            fig.st_enc_by_month_fig(compare.charts, main_colR)
+            fig.st_rvu_by_month_fig(compare.charts, main_colR)
+
+            def render_by_quarter():
+                colL, colR = st.columns(2)
+                fig.st_enc_by_quarter_fig(data.charts, colL)
+                fig.st_rvu_by_quarter_fig(data.charts, colL)
+                fig.st_enc_by_quarter_fig(compare.charts, colR)
+                fig.st_rvu_by_quarter_fig(compare.charts, colR)
+
+            def render_by_day():
+                colL, colR = st.columns(2)
+                fig.st_enc_by_day_fig(data.charts, colL)
+                fig.st_rvu_by_day_fig(data.charts, colL)
+                fig.st_enc_by_day_fig(compare.charts, colR)
+                fig.st_rvu_by_day_fig(compare.charts, colR)
+                st.markdown(zoom_caption, unsafe_allow_html=True)
+
+        render_on_demand("By Quarter", "show_by_quarter", render_by_quarter)
+        render_on_demand("By Day", "show_by_day", render_by_day)
 
         # Outpatient Summary
         st.header("Outpatient")
@@ -329,9 +436,12 @@ def render_main(
         # Inpatient Summary
         st.header("Inpatient")
         if compare is None:
-            inpt_enc_ct = st.empty()
+            render_on_demand(
+                "Encounters by Day",
+                "show_inpt_by_day",
+                lambda: fig.st_inpt_encs_fig(data.charts, st),
+            )
             colL, colR = st.columns(2)
-            fig.st_inpt_encs_fig(partitions, inpt_enc_ct)
             fig.st_inpt_vs_outpt_encs_fig(stats, colL)
             fig.st_inpt_vs_outpt_rvu_fig(stats, colR)
         else:
@@ -348,3 +458,85 @@ def render_main(
     st.header("Source Data")
     dataset_ct = st.empty()
     render_dataset(data, dataset_ct)
+
+
+def render_group(group: data.GroupRvuData) -> None:
+    """Builds the main panel for the All providers view using data.GroupRvuData"""
+    if group is None:
+        return
+
+    st.header("All Providers")
+    st.write(
+        f"{group.start_date.strftime('%b %d, %Y (%a)')} to {group.end_date.strftime('%b %d, %Y (%a)')}"
+    )
+    if len(group.stats.index) == 0:
+        st.write("No data for selected time period.")
+        return
+
+    # Leaderboard of summary stats, highest wRVUs first
+    stats = group.stats.sort_values("ttl_wrvu", ascending=False)
+    leaderboard = pd.DataFrame(
+        {
+            "Encounters": stats.ttl_encs,
+            "Total wRVU": stats.ttl_wrvu.round(1),
+            "wRVU / encounter": stats.wrvu_per_encs.round(2),
+            "Clinic days": stats.outpt_num_days,
+            "Patients / day": stats.outpt_num_pts_per_day.round(1),
+            "wRVU / day": stats.outpt_wrvu_per_day.round(1),
+            "Sick visits": stats.sick_num_pts,
+            "Well visits": stats.wcc_num_pts,
+            "Inpatient encounters": stats.inpt_num_pts,
+            "Medicaid wRVU %": (
+                stats.outpt_medicaid_wrvu
+                / stats.outpt_ttl_wrvu.where(stats.outpt_ttl_wrvu != 0)
+                * 100
+            ).round(1),
+            "Last Visit": stats.end_date,
+        }
+    ).rename_axis("Provider")
+    st.dataframe(leaderboard, use_container_width=True)
+
+    # Comparison graphs
+    enc_ct, rvu_ct = st.columns(2)
+    fig.st_group_enc_by_month_fig(group.charts, enc_ct)
+    fig.st_group_rvu_by_month_fig(group.charts, rvu_ct)
+    st.markdown(
+        '<p style="margin-top:-15px; margin-bottom:10px; text-align:center; color:#A9A9A9">RVU graphs do not include charges posted outside of dates, so totals may not match the table above.</p>',
+        unsafe_allow_html=True,
+    )
+    fig.st_group_rvu_per_enc_fig(stats, st)
+
+
+def render_perf(spans: list[perf.Span]) -> None:
+    """Show timing of each stage in this run and cache usage. Shown when the URL has ?perf=1."""
+    st.header("Performance")
+    if spans:
+        df = pd.DataFrame(
+            {
+                "Stage": ["\u2003" * s.depth + s.name for s in spans],
+                "ms": [
+                    None if s.seconds is None else round(s.seconds * 1000, 1)
+                    for s in spans
+                ],
+                "Rows": pd.array([s.rows for s in spans], dtype="Int64"),
+                "Memory change (MB)": [
+                    None if s.rss_mb is None else round(s.rss_mb, 1) for s in spans
+                ],
+                "Details": [
+                    ", ".join(f"{k}={v}" for k, v in s.fields.items()) for s in spans
+                ],
+            }
+        )
+        total = sum(s.seconds or 0 for s in spans if s.depth == 0)
+        st.write(f"Total of top level stages: {total * 1000:.0f} ms")
+        st.dataframe(df, hide_index=True, use_container_width=True)
+    else:
+        st.write("No stages were timed in this run.")
+
+    caches = {
+        "process()": data._processed.info(),
+        "Visit log indexes": data._visit_indexes.info(),
+        "Visit log results": data._validated.info(),
+    }
+    st.write("Caches:")
+    st.dataframe(pd.DataFrame(caches).T, use_container_width=True)